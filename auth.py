@@ -1,6 +1,6 @@
 import os
 import json
-import requests
+from http_session import get_session
 import hashlib
 import uuid
 import base64
@@ -109,7 +109,7 @@ class MinecraftAuth:
                 "requestUser": True
             }
             
-            response = requests.post(f"{self.auth_server}/authenticate", json=data)
+            response = get_session().post(f"{self.auth_server}/authenticate", json=data)
             if response.status_code != 200:
                 return False, "登录失败：邮箱或密码错误"
             
@@ -172,7 +172,7 @@ class MinecraftAuth:
                 "requestUser": True
             }
             
-            response = requests.post(f"{self.littleskin_api}/authserver/authenticate", json=data)
+            response = get_session().post(f"{self.littleskin_api}/authserver/authenticate", json=data)
             if response.status_code != 200:
                 return False, "登录失败：邮箱或密码错误"
             
@@ -276,9 +276,9 @@ class MinecraftAuth:
             }
             
             if profile["type"] == "mojang":
-                response = requests.post(f"{self.auth_server}/validate", json=data)
+                response = get_session().post(f"{self.auth_server}/validate", json=data)
             else:  # littleskin
-                response = requests.post(f"{self.littleskin_api}/authserver/validate", json=data)
+                response = get_session().post(f"{self.littleskin_api}/authserver/validate", json=data)
                 
             return response.status_code == 204
             
@@ -298,9 +298,9 @@ class MinecraftAuth:
             }
             
             if profile["type"] == "mojang":
-                response = requests.post(f"{self.auth_server}/refresh", json=data)
+                response = get_session().post(f"{self.auth_server}/refresh", json=data)
             else:  # littleskin
-                response = requests.post(f"{self.littleskin_api}/authserver/refresh", json=data)
+                response = get_session().post(f"{self.littleskin_api}/authserver/refresh", json=data)
                 
             if response.status_code != 200:
                 return False, "刷新令牌失败"
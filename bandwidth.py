@@ -0,0 +1,98 @@
+import time
+import threading
+from transfer_policy import DownloadCancelled
+
+# 下载优先级，数字越小越优先
+PRIORITY_CRITICAL = 0  # 启动必需：客户端、库文件
+PRIORITY_ASSETS = 1    # 资源文件
+PRIORITY_MODS = 2      # 模组等后台下载
+PRIORITIES = (PRIORITY_CRITICAL, PRIORITY_ASSETS, PRIORITY_MODS)
+
+# 令牌桶容量对应的秒数（允许的突发量）
+BURST_SECONDS = 0.5
+MIN_BURST_BYTES = 64 * 1024
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+class BandwidthLimiter:
+    """全局令牌桶限速器
+
+    所有下载线程在写入数据前调用 consume()。rate 为 0 表示不限速。
+    有高优先级的线程在等待时，低优先级线程让出令牌。
+    """
+
+    def __init__(self, rate=0):
+        self._cond = threading.Condition()
+        self._waiting = {p: 0 for p in PRIORITIES}
+        self.rate = 0
+        self._tokens = 0.0
+        self._last = time.monotonic()
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        """设置限速（字节/秒），可在下载过程中随时调整"""
+        with self._cond:
+            self.rate = max(0, int(rate))
+            self._tokens = min(self._tokens, self._capacity())
+            self._last = time.monotonic()
+            self._cond.notify_all()
+
+    def _capacity(self):
+        return max(self.rate * BURST_SECONDS, MIN_BURST_BYTES)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._tokens + (now - self._last) * self.rate, self._capacity())
+        self._last = now
+
+    def _higher_waiting(self, priority):
+        return any(self._waiting[p] for p in PRIORITIES if p < priority)
+
+    def max_chunk(self):
+        """限速时单次读取的最大字节数（桶容量），不限速时返回 None"""
+        if self.rate <= 0:
+            return None
+        return int(self._capacity())
+
+    def wake(self):
+        """唤醒所有等待额度的线程（取消下载时调用，让它们立即检查 cancel_event）"""
+        with self._cond:
+            self._cond.notify_all()
+
+    def consume(self, n, priority=PRIORITY_ASSETS, cancel_event=None):
+        """申请 n 字节的额度，额度不足时阻塞
+
+        超过桶容量的申请拆成多份依次获取，不会一次透支，避免先突发几 MB 再长时间停顿。
+        等待期间 cancel_event 被设置时抛出 DownloadCancelled。
+        """
+        if self.rate <= 0:
+            return
+        with self._cond:
+            self._waiting[priority] += 1
+            try:
+                while n > 0 and self.rate > 0:
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise DownloadCancelled("下载已取消")
+                    self._refill()
+                    piece = min(n, self._capacity())
+                    if not self._higher_waiting(priority) and self._tokens >= piece:
+                        self._tokens -= piece
+                        n -= piece
+                        continue
+                    deficit = piece - self._tokens
+                    self._cond.wait(min(max(deficit / self.rate, 0.005), 0.1))
+            finally:
+                self._waiting[priority] -= 1
+                self._cond.notify_all()
+
+
+def get_bandwidth_limiter():
+    """获取进程内共享的限速器"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = BandwidthLimiter()
+    return _limiter
@@ -0,0 +1,417 @@
+"""下载性能基准测试：启动本地模拟镜像，测量 MinecraftDownloader 的下载速度
+
+示例：
+    python benchmark.py
+    python benchmark.py --assets 5000 --latency-ms 30 --bandwidth-mb 20 --runs 3 --output result.json
+
+每轮在全新的临时目录中依次测量：
+    version  冷启动 download_version（客户端和库文件）
+    assets   冷启动 download_assets（资源文件）
+    warm     新的下载器实例再次执行两者，所有文件都已存在
+结果以 JSON 输出（每秒文件数、MB/s、CPU 时间、峰值内存），便于长期跟踪性能变化。
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import random
+import hashlib
+import argparse
+import platform
+import tempfile
+import threading
+import statistics
+import multiprocessing
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, unquote
+from downloader import MinecraftDownloader, DEFAULT_MAX_WORKERS
+from http_session import get_session
+from metadata_cache import MetadataCache
+from mirror_scores import MirrorScores
+from bandwidth import BandwidthLimiter
+from object_store import ObjectStore
+from transfer_metrics import TransferMetrics
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCH_VERSION = "bench"
+BENCH_ASSET_INDEX = "bench-assets"
+# 模拟服务器每次写出的块大小
+SERVE_CHUNK = 64 * 1024
+PHASES = ("version", "assets", "warm")
+
+
+def _random_bytes(rng, size):
+    return rng.getrandbits(size * 8).to_bytes(size, 'little') if size else b""
+
+
+def _write(root, rel_path, data):
+    path = os.path.join(root, *rel_path.split('/'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def build_fixture(root, libraries=40, assets=3000, client_size=8 * 1024 * 1024, seed=1):
+    """生成模拟镜像上的文件（BMCLAPI 路径格式），返回写元数据所需的描述
+
+    文件内容由 seed 决定，相同参数每次生成的数据完全一致。
+    """
+    rng = random.Random(seed)
+    client = _random_bytes(rng, client_size)
+    client_sha1 = hashlib.sha1(client).hexdigest()
+    _write(root, f"v1/objects/{client_sha1}/client.jar", client)
+
+    library_entries = []
+    for i in range(libraries):
+        # 库文件大小大致在 16 KB 到 2 MB 之间，小文件居多
+        data = _random_bytes(rng, int(16 * 1024 * (128 ** rng.random())))
+        path = f"org/bench/lib{i}/1.0/lib{i}-1.0.jar"
+        _write(root, f"maven/{path}", data)
+        library_entries.append({
+            "name": f"org.bench:lib{i}:1.0",
+            "downloads": {"artifact": {
+                "path": path,
+                "url": f"https://libraries.minecraft.net/{path}",
+                "sha1": hashlib.sha1(data).hexdigest(),
+                "size": len(data),
+            }},
+        })
+
+    objects = {}
+    for i in range(assets):
+        # 资源文件大小大致在 512 B 到 256 KB 之间，与真实资源的分布相近
+        data = _random_bytes(rng, int(512 * (512 ** (rng.random() ** 2))))
+        sha1 = hashlib.sha1(data).hexdigest()
+        _write(root, f"assets/{sha1[:2]}/{sha1}", data)
+        objects[f"minecraft/bench/{i}.ogg"] = {"hash": sha1, "size": len(data)}
+
+    return {
+        "client": {"sha1": client_sha1, "size": len(client)},
+        "libraries": library_entries,
+        "objects": objects,
+    }
+
+
+def write_metadata(root, fixture, base):
+    """写入版本清单、版本 JSON 和资源索引（其中的地址依赖服务器端口）"""
+    index = json.dumps({"objects": fixture["objects"]}).encode('utf-8')
+    index_sha1 = hashlib.sha1(index).hexdigest()
+    _write(root, f"v1/packages/{index_sha1}/{BENCH_ASSET_INDEX}.json", index)
+
+    version_info = json.dumps({
+        "id": BENCH_VERSION,
+        "type": "release",
+        "mainClass": "net.minecraft.client.main.Main",
+        "assets": BENCH_ASSET_INDEX,
+        "assetIndex": {
+            "id": BENCH_ASSET_INDEX,
+            "url": f"{base}v1/packages/{index_sha1}/{BENCH_ASSET_INDEX}.json",
+            "sha1": index_sha1,
+            "size": len(index),
+        },
+        "downloads": {"client": {
+            "url": f"https://piston-data.mojang.com/v1/objects/{fixture['client']['sha1']}/client.jar",
+            **fixture["client"],
+        }},
+        "libraries": fixture["libraries"],
+    }).encode('utf-8')
+    version_sha1 = hashlib.sha1(version_info).hexdigest()
+    _write(root, f"v1/packages/{version_sha1}/{BENCH_VERSION}.json", version_info)
+
+    manifest = {
+        "latest": {"release": BENCH_VERSION, "snapshot": BENCH_VERSION},
+        "versions": [{
+            "id": BENCH_VERSION,
+            "type": "release",
+            "url": f"{base}v1/packages/{version_sha1}/{BENCH_VERSION}.json",
+        }],
+    }
+    _write(root, "mc/game/version_manifest.json", json.dumps(manifest).encode('utf-8'))
+
+
+class ShapedRequestHandler(BaseHTTPRequestHandler):
+    """模拟镜像：每个请求增加固定延迟，并按连接限制带宽，支持单个 Range
+
+    设置了错误率时，按该概率随机返回 503 或在传输中途断开连接。
+    """
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        path = unquote(urlsplit(self.path).path).lstrip('/')
+        if path == "__stats":
+            body = json.dumps(server.stats()).encode('utf-8')
+            self._headers(200, len(body))
+            self.wfile.write(body)
+            return
+
+        if server.latency:
+            time.sleep(server.latency)
+        failure = server.roll_failure()
+        if failure == "status":
+            self.send_error(503)
+            return
+        file_path = os.path.join(server.root, *path.split('/'))
+        if '..' in path.split('/') or not os.path.isfile(file_path):
+            self.send_error(404)
+            return
+        size = os.path.getsize(file_path)
+        start, end = 0, size - 1
+        match = re.match(r"^bytes=(\d+)-(\d*)$", self.headers.get('Range', ''))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            if start >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', f"bytes */{size}")
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self._headers(206, end - start + 1, f"bytes {start}-{end}/{size}")
+        else:
+            self._headers(200, size)
+
+        remaining = end - start + 1
+        if failure == "truncate":
+            # 只发送一半数据后断开，模拟不稳定的连接
+            remaining //= 2
+            self.close_connection = True
+        sent_at = time.monotonic()
+        sent = 0
+        with open(file_path, 'rb') as f:
+            f.seek(start)
+            while remaining > 0:
+                chunk = f.read(min(SERVE_CHUNK, remaining))
+                if not chunk:
+                    break
+                server.limiter.consume(len(chunk))
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+                sent += len(chunk)
+                if server.connection_rate:
+                    delay = sent / server.connection_rate - (time.monotonic() - sent_at)
+                    if delay > 0:
+                        time.sleep(delay)
+        server.count(sent)
+
+    def _headers(self, status, length, content_range=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(length))
+        self.send_header('Accept-Ranges', 'bytes')
+        if content_range:
+            self.send_header('Content-Range', content_range)
+        self.end_headers()
+
+
+class ShapedMirrorServer(ThreadingHTTPServer):
+    """带延迟和带宽模拟的本地镜像服务器"""
+
+    request_queue_size = 128
+
+    def __init__(self, address, root, latency=0.0, bandwidth=0, connection_bandwidth=0, error_rate=0.0, seed=1):
+        self.root = root
+        self.latency = latency
+        self.connection_rate = connection_bandwidth
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self.limiter = BandwidthLimiter(bandwidth)
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._bytes = 0
+        super().__init__(address, ShapedRequestHandler)
+
+    def roll_failure(self):
+        """按错误率决定本次请求是否失败，返回 None、'status' 或 'truncate'"""
+        if not self.error_rate:
+            return None
+        with self._lock:
+            roll = self._random.random()
+        if roll >= self.error_rate:
+            return None
+        return "status" if roll < self.error_rate / 2 else "truncate"
+
+    def count(self, nbytes):
+        with self._lock:
+            self._requests += 1
+            self._bytes += nbytes
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self._requests, "bytes": self._bytes}
+
+
+def _run_server(root, fixture, latency, bandwidth, connection_bandwidth, error_rate, seed, ready):
+    server = ShapedMirrorServer(("127.0.0.1", 0), root, latency, bandwidth, connection_bandwidth, error_rate, seed)
+    base = f"http://127.0.0.1:{server.server_address[1]}/"
+    write_metadata(root, fixture, base)
+    ready.put(base)
+    server.serve_forever()
+
+
+def _server_stats(base):
+    return get_session().get(base + "__stats").json()
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位为 KB，macOS 上为字节
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def _measure(phase, base, func, metrics):
+    metrics.reset()
+    stats_before = _server_stats(base)
+    cpu_start = time.process_time()
+    started = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - started
+    cpu_seconds = time.process_time() - cpu_start
+    stats_after = _server_stats(base)
+    files = stats_after["requests"] - stats_before["requests"]
+    nbytes = stats_after["bytes"] - stats_before["bytes"]
+    return {
+        "phase": phase,
+        "seconds": round(seconds, 3),
+        "files": files,
+        "bytes": nbytes,
+        "files_per_second": round(files / seconds, 1) if seconds > 0 else None,
+        "mb_per_second": round(nbytes / seconds / (1024 * 1024), 2) if seconds > 0 else None,
+        "cpu_seconds": round(cpu_seconds, 3),
+        "peak_rss_mb": _peak_rss_mb(),
+        # 下载器记录的各阶段平均耗时（秒/文件）
+        "mean_timings": {name: timing["mean"] for name, timing in metrics.snapshot()["timings"].items()},
+    }
+
+
+def run_once(base, work_dir, jobs):
+    """在 work_dir 中完整执行一轮测量"""
+    metrics = TransferMetrics()
+
+    def make_downloader():
+        # 所有缓存都放在本轮的临时目录中，不读写启动器自己的缓存
+        return MinecraftDownloader(
+            os.path.join(work_dir, "game"), base, max_workers=jobs,
+            metadata_cache=MetadataCache(os.path.join(work_dir, "metadata")),
+            multi_mirror=False,
+            mirror_scores=MirrorScores(os.path.join(work_dir, "mirror_scores.json")),
+            bandwidth_limiter=BandwidthLimiter(),
+            object_store=ObjectStore(os.path.join(work_dir, "objects")),
+            metrics=metrics,
+        )
+
+    cold = make_downloader()
+    results = [
+        _measure("version", base, lambda: cold.download_version(BENCH_VERSION), metrics),
+        _measure("assets", base, lambda: cold.download_assets(BENCH_VERSION), metrics),
+    ]
+
+    def warm():
+        downloader = make_downloader()
+        downloader.download_version(BENCH_VERSION)
+        downloader.download_assets(BENCH_VERSION)
+    results.append(_measure("warm", base, warm, metrics))
+    # 检查的文件数：所有文件都已存在，没有下载请求
+    results[-1]["files_checked"] = results[0]["files"] + results[1]["files"]
+    if results[-1]["seconds"] > 0:
+        results[-1]["files_checked_per_second"] = round(results[-1]["files_checked"] / results[-1]["seconds"], 1)
+    return results
+
+
+def summarize(runs):
+    """各阶段的中位数"""
+    summary = {}
+    for phase in PHASES:
+        rows = [row for run in runs for row in run if row["phase"] == phase]
+        summary[phase] = {
+            key: round(statistics.median(row[key] for row in rows), 3)
+            for key in ("seconds", "files_per_second", "mb_per_second", "cpu_seconds", "files_checked_per_second")
+            if all(row.get(key) is not None for row in rows)
+        }
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PMCL 下载性能基准测试")
+    parser.add_argument("--libraries", type=int, default=40, help="库文件数量")
+    parser.add_argument("--assets", type=int, default=3000, help="资源文件数量")
+    parser.add_argument("--client-mb", type=float, default=8, help="客户端 jar 大小（MB）")
+    parser.add_argument("--latency-ms", type=float, default=0, help="每个请求增加的延迟（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0, help="请求随机失败（503 或中途断开）的比例")
+    parser.add_argument("--bandwidth-mb", type=float, default=0, help="服务器总带宽（MB/s，0 为不限）")
+    parser.add_argument("--connection-bandwidth-mb", type=float, default=0, help="单个连接的带宽（MB/s，0 为不限）")
+    parser.add_argument("--jobs", type=int, default=None, help="下载并发数（默认使用下载器的默认值）")
+    parser.add_argument("--runs", type=int, default=1, help="测量轮数")
+    parser.add_argument("--seed", type=int, default=1, help="生成数据的随机种子")
+    parser.add_argument("--output", help="结果另外写入该 JSON 文件")
+    args = parser.parse_args(argv)
+
+    jobs = args.jobs or DEFAULT_MAX_WORKERS
+    temp_root = tempfile.mkdtemp(prefix="pmcl-bench-")
+    server = None
+    try:
+        mirror_root = os.path.join(temp_root, "mirror")
+        fixture = build_fixture(mirror_root, args.libraries, args.assets, int(args.client_mb * 1024 * 1024), args.seed)
+        # 服务器在独立进程中运行，不计入下载器的 CPU 时间和内存
+        ready = multiprocessing.Queue()
+        server = multiprocessing.Process(target=_run_server, daemon=True, args=(
+            mirror_root, fixture, args.latency_ms / 1000, int(args.bandwidth_mb * 1024 * 1024),
+            int(args.connection_bandwidth_mb * 1024 * 1024), args.error_rate, args.seed, ready))
+        server.start()
+        base = ready.get(timeout=60)
+
+        runs = []
+        for i in range(args.runs):
+            work_dir = os.path.join(temp_root, f"run{i}")
+            runs.append(run_once(base, work_dir, jobs))
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        report = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "environment": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+            },
+            "config": {
+                "libraries": args.libraries,
+                "assets": args.assets,
+                "client_bytes": fixture["client"]["size"],
+                "latency_ms": args.latency_ms,
+                "bandwidth_mb": args.bandwidth_mb,
+                "connection_bandwidth_mb": args.connection_bandwidth_mb,
+                "error_rate": args.error_rate,
+                "jobs": jobs,
+                "seed": args.seed,
+            },
+            "runs": runs,
+            "summary": summarize(runs),
+        }
+    finally:
+        if server is not None:
+            server.terminate()
+        shutil.rmtree(temp_root, ignore_errors=True)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
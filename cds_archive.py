@@ -0,0 +1,152 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from metadata_cache import DEFAULT_CACHE_DIR
+
+# 动态 CDS 存档（-XX:ArchiveClassesAtExit）需要 Java 13+；19+ 可以由 JVM 自动创建和校验
+CDS_MIN_JAVA = 13
+AUTO_ARCHIVE_JAVA = 19
+# 最多保留多少个存档（按最近使用时间）
+KEEP_ARCHIVES = 8
+# 每种启动方式保留的启动耗时样本数
+KEEP_SAMPLES = 5
+# 游戏日志中表示类加载基本完成、开始初始化渲染的行
+STARTUP_MARKER = re.compile(r"Backend library: LWJGL|LWJGL Version")
+STARTUP_TIMEOUT = 300
+
+MODE_DUMP = "dump"  # 本次启动没有存档，退出时生成
+MODE_SHARED = "shared"  # 本次启动使用已有存档
+
+
+class CdsSession:
+    """一次启动使用的 CDS 存档"""
+
+    def __init__(self, key, mode, archive_path, args):
+        self.key = key
+        self.mode = mode
+        self.archive_path = archive_path
+        self.args = args
+
+
+class CdsArchives:
+    """按 版本 + Java + 模组组合 生成的 AppCDS 动态存档
+
+    第一次启动时让 JVM 在退出时把加载过的类写入存档，之后的启动通过
+    -XX:SharedArchiveFile 直接映射存档，省去解析和校验这些类的时间。
+    存档的 key 包含 Java、classpath 中每个 jar 的路径/大小/修改时间以及 mods 目录，
+    其中任何变化都会生成新的存档，旧存档按最近使用时间清理。
+    """
+
+    def __init__(self, root=None):
+        self.root = root or os.path.join(DEFAULT_CACHE_DIR, 'cds')
+        self.stats_path = os.path.join(self.root, 'stats.json')
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _stamp(path):
+        try:
+            st = os.stat(path)
+            return [path, st.st_size, st.st_mtime_ns]
+        except OSError:
+            return [path, None, None]
+
+    def archive_key(self, java_path, java_major, classpath, mods_dir):
+        mods = []
+        if os.path.isdir(mods_dir):
+            mods = [self._stamp(os.path.join(mods_dir, name)) for name in sorted(os.listdir(mods_dir))]
+        key = json.dumps([self._stamp(java_path), java_major, [self._stamp(path) for path in classpath], mods])
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def prepare(self, java_path, java_major, classpath, mods_dir):
+        """返回本次启动的 CdsSession；Java 版本不支持时返回 None"""
+        if java_major is None or java_major < CDS_MIN_JAVA:
+            return None
+        key = self.archive_key(java_path, java_major, classpath, mods_dir)
+        archive_path = os.path.join(self.root, f"{key}.jsa")
+        os.makedirs(self.root, exist_ok=True)
+        exists = os.path.exists(archive_path)
+        if java_major >= AUTO_ARCHIVE_JAVA:
+            # JVM 自己检查存档是否可用，不可用时在退出时重新生成
+            args = ["-XX:+AutoCreateSharedArchive", f"-XX:SharedArchiveFile={archive_path}"]
+        elif exists:
+            args = [f"-XX:SharedArchiveFile={archive_path}"]
+        else:
+            args = [f"-XX:ArchiveClassesAtExit={archive_path}"]
+        if exists:
+            os.utime(archive_path)  # 记录最近使用时间，供清理时参考
+        else:
+            self._prune()
+        return CdsSession(key, MODE_SHARED if exists else MODE_DUMP, archive_path, args)
+
+    def _prune(self):
+        archives = []
+        for name in os.listdir(self.root):
+            if name.endswith('.jsa'):
+                path = os.path.join(self.root, name)
+                try:
+                    archives.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+        archives.sort(reverse=True)
+        for _, path in archives[KEEP_ARCHIVES - 1:]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _load_stats(self):
+        try:
+            with open(self.stats_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def record_startup(self, session, seconds):
+        """记录一次启动耗时，返回 (未使用存档的平均耗时, 使用存档的平均耗时)"""
+        with self._lock:
+            stats = self._load_stats()
+            entry = stats.setdefault(session.key, {MODE_DUMP: [], MODE_SHARED: []})
+            samples = entry.setdefault(session.mode, [])
+            samples.append(round(seconds, 3))
+            del samples[:-KEEP_SAMPLES]
+            # 只保留现存存档的统计
+            for key in list(stats):
+                if key != session.key and not os.path.exists(os.path.join(self.root, f"{key}.jsa")):
+                    del stats[key]
+            tmp_path = self.stats_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(stats, f)
+            os.replace(tmp_path, self.stats_path)
+
+        def mean(values):
+            return sum(values) / len(values) if values else None
+        return mean(entry.get(MODE_DUMP, [])), mean(entry.get(MODE_SHARED, []))
+
+
+def watch_startup(log_path, process, callback, started, timeout=STARTUP_TIMEOUT):
+    """在后台线程中等待游戏日志出现 STARTUP_MARKER，以从 started（perf_counter）到此的秒数调用 callback"""
+
+    def run():
+        buffer = ""
+        try:
+            with open(log_path, 'r', encoding='utf-8', errors='replace') as f:
+                while time.perf_counter() - started < timeout:
+                    chunk = f.read()
+                    if chunk:
+                        buffer = (buffer + chunk)[-4096:]
+                        if STARTUP_MARKER.search(buffer):
+                            callback(time.perf_counter() - started)
+                            return
+                    elif process.poll() is not None:
+                        return
+                    else:
+                        time.sleep(0.1)
+        except OSError as e:
+            print(f"[WARN] 无法读取游戏日志 {log_path}：{e}")
+
+    thread = threading.Thread(target=run, name="startup-watch", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,165 @@
+import json
+import time
+import sqlite3
+import threading
+from download_planner import DownloadJob, DownloadPlan
+
+# 文件状态的批量写入间隔（秒）：崩溃时最多丢失这段时间内的完成记录，恢复时会重新校验
+FLUSH_INTERVAL = 0.5
+# 保留多少个已结束的下载记录
+KEEP_FINISHED_RUNS = 20
+
+# 任务状态
+RUN_RUNNING = "running"
+RUN_DONE = "done"
+RUN_FAILED = "failed"
+RUN_CANCELLED = "cancelled"
+RUN_DISMISSED = "dismissed"  # 用户选择不再继续的下载
+JOB_PENDING = "pending"
+JOB_ACTIVE = "active"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    version TEXT NOT NULL,
+    game_dir TEXT NOT NULL,
+    tasks TEXT NOT NULL,
+    state TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    run_id INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    url TEXT NOT NULL,
+    sha1 TEXT,
+    size INTEGER,
+    kind TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (run_id, path)
+);
+"""
+
+
+class DownloadJournal:
+    """持久化的下载任务日志（SQLite）
+
+    记录每次下载计划中的全部文件及其状态（待下载、下载中、已完成、失败）。
+    启动器关闭或崩溃后，可以直接从日志恢复未完成的文件继续下载，
+    不必重新规划、重新检查所有文件。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._pending = {}  # (run_id, path) -> 状态，等待批量写入
+        self._last_flush = time.monotonic()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # WAL 模式下写入不阻塞读取；synchronous=NORMAL 在断电时最多丢失最后几个事务
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._db.close()
+
+    def create_run(self, version, game_dir, tasks, plan):
+        """记录一个新的下载计划，返回 run_id"""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                cursor = self._db.execute(
+                    "INSERT INTO runs (version, game_dir, tasks, state, created, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                    (version, game_dir, json.dumps(list(tasks)), RUN_RUNNING, now, now),
+                )
+                run_id = cursor.lastrowid
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO jobs (run_id, path, url, sha1, size, kind, priority, state) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(run_id, job.path, job.url, job.sha1, job.size, job.kind, job.priority, JOB_PENDING) for job in plan.jobs],
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return run_id
+
+    def mark(self, run_id, job, state):
+        """更新文件状态；先放入内存，每 FLUSH_INTERVAL 秒批量写入一次"""
+        with self._lock:
+            self._pending[(run_id, job.path)] = state
+            due = time.monotonic() - self._last_flush >= FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            updates = [(state, run_id, path) for (run_id, path), state in self._pending.items()]
+            self._pending.clear()
+            self._last_flush = time.monotonic()
+            self._db.execute("BEGIN")
+            self._db.executemany("UPDATE jobs SET state = ? WHERE run_id = ? AND path = ?", updates)
+            self._db.execute("COMMIT")
+
+    def finish_run(self, run_id, state):
+        """结束一次下载；成功完成的计划删除文件明细，只保留最近的记录"""
+        self.flush()
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.execute("UPDATE runs SET state = ?, updated = ? WHERE id = ?", (state, time.time(), run_id))
+            if state == RUN_DONE:
+                self._db.execute("DELETE FROM jobs WHERE run_id = ?", (run_id,))
+            old_runs = [row[0] for row in self._db.execute(
+                "SELECT id FROM runs WHERE state != ? ORDER BY id DESC LIMIT -1 OFFSET ?", (RUN_RUNNING, KEEP_FINISHED_RUNS))]
+            for old_id in old_runs:
+                self._db.execute("DELETE FROM jobs WHERE run_id = ?", (old_id,))
+                self._db.execute("DELETE FROM runs WHERE id = ?", (old_id,))
+            self._db.execute("COMMIT")
+
+    def unfinished_runs(self):
+        """中断（崩溃、关闭）、取消或失败的下载：[{id, version, game_dir, tasks, remaining, remaining_bytes}]"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT r.id, r.version, r.game_dir, r.tasks, COUNT(j.path), COALESCE(SUM(j.size), 0) "
+                "FROM runs r JOIN jobs j ON j.run_id = r.id AND j.state != ? "
+                "WHERE r.state IN (?, ?, ?) GROUP BY r.id ORDER BY r.id",
+                (JOB_DONE, RUN_RUNNING, RUN_FAILED, RUN_CANCELLED),
+            ).fetchall()
+        return [
+            {"id": run_id, "version": version, "game_dir": game_dir, "tasks": json.loads(tasks),
+             "remaining": remaining, "remaining_bytes": remaining_bytes}
+            for run_id, version, game_dir, tasks, remaining, remaining_bytes in rows
+        ]
+
+    def load_plan(self, run_id):
+        """未完成文件（含上次下载中、失败的文件）组成的下载计划"""
+        plan = DownloadPlan()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT url, path, sha1, size, kind, priority FROM jobs WHERE run_id = ? AND state != ?",
+                (run_id, JOB_DONE),
+            ).fetchall()
+        for url, path, sha1, size, kind, priority in rows:
+            plan.add(DownloadJob(url, path, sha1, size, kind, priority))
+        return plan
+
+
+class JournalRun:
+    """execute_plan 使用的单次下载记录"""
+
+    def __init__(self, journal, run_id):
+        self.journal = journal
+        self.run_id = run_id
+
+    def mark(self, job, state):
+        self.journal.mark(self.run_id, job, state)
+
+    def finish(self, state):
+        self.journal.finish_run(self.run_id, state)
@@ -0,0 +1,141 @@
+import time
+import threading
+from bandwidth import PRIORITY_CRITICAL, PRIORITY_ASSETS, PRIORITY_MODS
+
+# 各类文件的默认优先级
+KIND_PRIORITIES = {
+    "client": PRIORITY_CRITICAL,
+    "library": PRIORITY_CRITICAL,
+    "asset": PRIORITY_ASSETS,
+    "mod": PRIORITY_MODS,
+}
+
+# 大于该大小的文件视为大文件，调度时与小文件交替
+LARGE_FILE_SIZE = 1024 * 1024
+# 每个大文件之后跟随的小文件数量
+SMALL_BURST = 32
+
+
+class DownloadJob:
+    """下载计划中的单个文件"""
+
+    __slots__ = ("url", "path", "sha1", "size", "kind", "priority")
+
+    def __init__(self, url, path, sha1=None, size=None, kind="file", priority=None):
+        self.url = url
+        self.path = path
+        self.sha1 = sha1
+        self.size = size
+        self.kind = kind
+        self.priority = priority if priority is not None else KIND_PRIORITIES.get(kind, PRIORITY_ASSETS)
+
+    def __repr__(self):
+        return f"DownloadJob({self.kind}, {self.path}, {self.size})"
+
+
+class DownloadPlan:
+    """下载计划：开始传输前就确定好的全部缺失文件"""
+
+    def __init__(self):
+        self.jobs = []
+        self.skipped = 0  # 已存在且校验通过、无需下载的文件数
+        self._paths = set()
+
+    def add(self, job):
+        """加入一个任务，同一目标路径只保留一次"""
+        if job.path in self._paths:
+            return
+        self._paths.add(job.path)
+        self.jobs.append(job)
+
+    def __len__(self):
+        return len(self.jobs)
+
+    @property
+    def total_size(self):
+        return sum(job.size or 0 for job in self.jobs)
+
+    def critical_jobs(self):
+        return [job for job in self.jobs if job.priority == PRIORITY_CRITICAL]
+
+    def ordered(self):
+        """调度顺序：先按优先级，同一优先级内每个大文件后面跟一批小文件
+
+        大文件占满带宽，小文件的请求往返时间可以与之重叠，避免所有线程同时在等
+        小文件的响应或同时在下载大文件。
+        """
+        result = []
+        for priority in sorted({job.priority for job in self.jobs}):
+            result.extend(self._interleave([job for job in self.jobs if job.priority == priority]))
+        return result
+
+    def _interleave(self, jobs):
+        large = sorted((j for j in jobs if (j.size or 0) >= LARGE_FILE_SIZE), key=lambda j: -(j.size or 0))
+        small = [j for j in jobs if (j.size or 0) < LARGE_FILE_SIZE]
+        result = []
+        while large or small:
+            if large:
+                result.append(large.pop(0))
+            result.extend(small[:SMALL_BURST])
+            del small[:SMALL_BURST]
+        return result
+
+
+class PlanProgress:
+    """整个下载计划的字节级进度
+
+    给出 callback 时每个数据块都以 (percent, speed, current, total) 汇报；
+    界面等需要限频的场景应改用 snapshot() 定时采样（见 progress_bus）。
+    """
+
+    def __init__(self, total_bytes, callback=None, total_files=0):
+        self.total_bytes = total_bytes
+        self.total_files = total_files
+        self.callback = callback
+        self.done_bytes = 0
+        self.done_files = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.start_time = time.time()
+
+    @property
+    def current_bytes(self):
+        return self.done_bytes + sum(self._inflight.values())
+
+    @property
+    def speed(self):
+        elapsed = time.time() - self.start_time
+        return self.current_bytes / elapsed if elapsed > 0 else 0
+
+    @property
+    def eta(self):
+        """预计剩余秒数，无法估计时返回 None"""
+        speed = self.speed
+        if speed <= 0:
+            return None
+        return max(self.total_bytes - self.current_bytes, 0) / speed
+
+    def snapshot(self):
+        """返回 (已下载字节, 已完成文件数, 正在下载的文件路径列表)"""
+        with self._lock:
+            return self.current_bytes, self.done_files, list(self._inflight)
+
+    def _report(self):
+        if self.callback and self.total_bytes > 0:
+            current = min(self.current_bytes, self.total_bytes)
+            self.callback(current / self.total_bytes * 100, self.speed, current, self.total_bytes)
+
+    def file_callback(self, job):
+        """返回单个文件的进度回调，把它的字节数计入总进度"""
+        def callback(percent, speed, current, total):
+            with self._lock:
+                self._inflight[job.path] = current
+                self._report()
+        return callback
+
+    def file_done(self, job, size):
+        with self._lock:
+            self._inflight.pop(job.path, None)
+            self.done_bytes += size
+            self.done_files += 1
+            self._report()
@@ -1,10 +1,26 @@
 import os
 import json
-import requests
 import hashlib
 import time
-from urllib.parse import urljoin
-from threading import Event
+import math
+import socket
+from urllib.parse import urljoin, urlparse
+from threading import Event, Lock, BoundedSemaphore
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from http_session import get_download_session, set_host_pool_size
+from metadata_cache import MetadataCache
+from verify_index import VerifiedIndex
+from mirror_pool import MirrorPool
+from mirror_scores import get_mirror_scores
+from download_planner import DownloadJob, DownloadPlan, PlanProgress
+from bandwidth import get_bandwidth_limiter, PRIORITY_CRITICAL, PRIORITY_ASSETS
+from object_store import ObjectStore, sha1_file
+from scan_index import PresenceIndex
+from library_rules import rules_allow, native_artifact
+from file_writer import write_stream, preallocate, resume_offset, mark_resumable, discard_part, finish_part
+from transfer_metrics import get_transfer_metrics, current_transfer
+from transfer_policy import RetryPolicy, CircuitOpenError, DownloadCancelled, IncompleteDownloadError, is_retryable, get_circuit_breaker
+from download_journal import JOB_ACTIVE, JOB_DONE, JOB_FAILED, JOB_PENDING, RUN_DONE, RUN_FAILED, RUN_CANCELLED
 
 MIRROR_LIST = [
     {
@@ -20,19 +36,89 @@ MIRROR_LIST = [
     {
         "name": "Mojang",
         "manifest": "https://launchermeta.mojang.com/mc/game/version_manifest.json",
-        "base": "https://launchermeta.mojang.com/"
+        "base": "https://launchermeta.mojang.com/",
+        "official": True
     }
 ]
 
+# 资源文件的官方下载地址，实际下载时由镜像池换算成镜像地址
+ASSETS_BASE_URL = "https://resources.download.minecraft.net/"
+
+# 并发下载的默认参数：总线程数和单个主机的最大并发连接数
+DEFAULT_MAX_WORKERS = 16
+DEFAULT_PER_HOST_LIMIT = 8
+# 超过该大小且有多个镜像可用时，按字节范围分段从多个镜像同时下载
+SEGMENT_THRESHOLD = 8 * 1024 * 1024
+SEGMENT_MIN_SIZE = 2 * 1024 * 1024
+SEGMENTS_PER_MIRROR = 2
+# 文件下载不接受压缩编码：Content-Length 和 Range 的偏移都按原始字节计算，与版本信息中的大小一致
+IDENTITY_ENCODING = {"Accept-Encoding": "identity"}
+# 等待下载完成时检查取消请求的间隔（秒）
+CANCEL_POLL_INTERVAL = 0.05
+
+
+class VerificationError(Exception):
+    """下载的文件大小或 sha1 与版本信息不一致"""
+
+
+class DownloadFailed(Exception):
+    """下载计划中有文件在重试后仍然失败，failures 为 [(DownloadJob, 异常)]"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        details = "；".join(f"{os.path.basename(job.path)}: {error}" for job, error in failures[:3])
+        more = f" 等 {len(failures)} 个文件" if len(failures) > 3 else ""
+        super().__init__(f"{details}{more}下载失败")
+
+
+def _require_identity(response, url):
+    """镜像无视 Accept-Encoding: identity 返回了压缩的内容时报错，换其它镜像"""
+    encoding = response.headers.get('content-encoding', 'identity').lower()
+    if encoding not in ('', 'identity'):
+        raise VerificationError(f"{url} 返回了压缩的内容（{encoding}），无法校验大小和续传")
+
+
+def select_fastest_mirror(mirror_scores=None):
+    """根据镜像评分选择最快的镜像
+
+    已有历史评分时立即返回并在后台重新探测；首次运行时并发探测所有镜像，
+    使用第一个正常响应的镜像。
+    """
+    mirror_scores = mirror_scores or get_mirror_scores()
+    if mirror_scores.has_scores(MIRROR_LIST):
+        mirror_scores.refresh_in_background(MIRROR_LIST)
+        return mirror_scores.rank(MIRROR_LIST)[0]
+    return mirror_scores.probe_first(MIRROR_LIST)
+
+
 class MinecraftDownloader:
-    def __init__(self, game_dir, mirror_source=None):
+    def __init__(self, game_dir, mirror_source=None, max_workers=DEFAULT_MAX_WORKERS, per_host_limit=DEFAULT_PER_HOST_LIMIT, metadata_cache=None, multi_mirror=True, mirror_scores=None, bandwidth_limiter=None, object_store=None, metrics=None, retry_policy=None, circuit_breaker=None):
         self.game_dir = game_dir
         self.versions_dir = os.path.join(game_dir, "versions")
         self.libraries_dir = os.path.join(game_dir, "libraries")
         self.assets_dir = os.path.join(game_dir, "assets")
         self.pause_event = Event()
         self.pause_event.set()  # 默认不暂停
-        if mirror_source:
+        self.cancel_event = Event()
+        self._active_responses = set()  # 正在传输的响应，取消时直接关闭其连接
+        self._active_lock = Lock()
+        self.max_workers = max(1, int(max_workers))
+        self.per_host_limit = max(1, int(per_host_limit))
+        self._host_slots = {}
+        self._host_slots_lock = Lock()
+        self.metadata_cache = metadata_cache or MetadataCache()
+        self._version_info = {}
+        self.mirror_scores = mirror_scores or get_mirror_scores()
+        self.bandwidth_limiter = bandwidth_limiter or get_bandwidth_limiter()
+        self.object_store = object_store or ObjectStore()
+        self.metrics = metrics or get_transfer_metrics()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker or get_circuit_breaker()
+        self.verified_index = VerifiedIndex(os.path.join(game_dir, ".pmcl", "verified_index.json"))
+        if isinstance(mirror_source, dict):
+            # 已经选好的镜像（MIRROR_LIST 中的一项），多个下载器共用同一个镜像时使用
+            self.current_mirror = mirror_source
+        elif mirror_source:
             # Use the provided mirror source URL directly
             self.current_mirror = {
                 "name": f"Custom ({mirror_source})",
@@ -44,148 +130,636 @@ class MinecraftDownloader:
             self.current_mirror = self.select_fastest_mirror()
 
         self.version_manifest_url = self.current_mirror["manifest"]
+        # 多镜像模式下，当前镜像优先，其余镜像作为备用和分段下载的来源
+        self.mirror_pool = MirrorPool([self.current_mirror] + (MIRROR_LIST if multi_mirror else []), self.mirror_scores)
         
         # 创建必要的目录
         for directory in [self.versions_dir, self.libraries_dir, self.assets_dir]:
             os.makedirs(directory, exist_ok=True)
     
     def select_fastest_mirror(self):
-        best = None
-        best_time = float('inf')
-        for mirror in MIRROR_LIST:
-            try:
-                start = time.time()
-                resp = requests.get(mirror["manifest"], timeout=3)
-                elapsed = time.time() - start
-                if resp.status_code == 200 and elapsed < best_time:
-                    best = mirror
-                    best_time = elapsed
-            except Exception as e:
-                continue
-        return best if best else MIRROR_LIST[0]
+        return select_fastest_mirror(self.mirror_scores)
 
     def get_fastest_mirror(self):
         return self.current_mirror
 
     def get_version_manifest(self):
-        """获取版本清单"""
-        response = requests.get(self.current_mirror['manifest'])
-        return response.json()
+        """获取版本清单（带磁盘缓存），当前镜像不可用时依次尝试其它镜像"""
+        last_error = None
+        for mirror in self.mirror_pool.ordered():
+            try:
+                return self.metadata_cache.get_manifest(mirror['manifest'])
+            except Exception as e:
+                last_error = e
+                self.mirror_pool.report_failure(mirror)
+        raise last_error
     
     def get_version_info(self, version):
         """获取特定版本的详细信息"""
+        if version in self._version_info:
+            return self._version_info[version]
         manifest = self.get_version_manifest()
         for v in manifest["versions"]:
             if v["id"] == version:
-                response = requests.get(v["url"])
-                return response.json()
+                info = self.metadata_cache.get_version_json(version, v["url"])
+                self._version_info[version] = info
+                return info
         return None
+
+    def get_asset_index(self, version_info):
+        """获取资源索引，并确保游戏目录中存在 indexes/<id>.json"""
+        assets_index = version_info["assetIndex"]
+        assets_index_path = os.path.join(self.assets_dir, "indexes", f"{assets_index['id']}.json")
+        assets_data = self.metadata_cache.get_asset_index(assets_index["id"], assets_index["url"])
+        if not os.path.exists(assets_index_path):
+            os.makedirs(os.path.dirname(assets_index_path), exist_ok=True)
+            with open(assets_index_path, 'w') as f:
+                json.dump(assets_data, f)
+        return assets_data
     
-    def download_file(self, url, target_path, progress_callback=None):
-        """下载文件到指定路径"""
+    def _open_transfer(self, url, part_path):
+        """发起请求，若存在 .part 文件则尝试用 Range 续传
+
+        返回 (response, resume_from)，resume_from 为 0 表示从头下载。
+        """
+        resume_from = resume_offset(part_path)
+        if resume_from:
+            response = get_download_session().get(url, stream=True, headers={"Range": f"bytes={resume_from}-", **IDENTITY_ENCODING})
+            content_range = response.headers.get('content-range', '')
+            if response.status_code == 206 and content_range.startswith(f"bytes {resume_from}-"):
+                return response, resume_from
+            if response.status_code == 200:
+                # 服务器忽略了 Range，直接从头使用这个响应
+                discard_part(part_path)
+                return response, 0
+            if response.status_code not in (206, 416):
+                # 503、429 等临时错误：保留 .part，重试时从同一位置续传
+                with response:
+                    response.raise_for_status()
+            response.close()
+            # 服务器拒绝该范围（.part 已失效）或返回了错误的范围，从头开始
+            discard_part(part_path)
+        response = get_download_session().get(url, stream=True, headers=IDENTITY_ENCODING)
+        response.raise_for_status()
+        return response, 0
+
+    def download_file(self, url, target_path, progress_callback=None, sha1=None, size=None, priority=PRIORITY_ASSETS):
+        """下载文件到指定路径（先写入 .part，完成后再重命名，支持断点续传）
+
+        给出 sha1/size 时在下载过程中同步计算哈希，不一致立即报错并删除 .part。
+        """
+        self._raise_if_cancelled()
         os.makedirs(os.path.dirname(target_path), exist_ok=True)
-        response = requests.get(url, stream=True)
-        total_size = int(response.headers.get('content-length', 0))
-        downloaded_size = 0
+        part_path = target_path + ".part"
+        record = current_transfer()
+        setup_before = record.dns + record.connect + record.tls
+        request_start = time.perf_counter()
+        response, resume_from = self._open_transfer(url, part_path)
+        # 首字节时间不含本次新建连接的耗时（已分别记录）
+        record.ttfb += time.perf_counter() - request_start - (record.dns + record.connect + record.tls - setup_before)
+        record.resumed = bool(resume_from)
+        retries = getattr(response.raw, "retries", None)
+        if retries is not None:
+            record.retries += len(retries.history)
+        try:
+            _require_identity(response, url)
+        except VerificationError:
+            response.close()
+            raise
+        content_length = int(response.headers.get('content-length', 0))
+        total_size = resume_from + content_length if content_length else (size or 0)
+        if size and total_size != size:
+            response.close()
+            self._discard(part_path)
+            raise VerificationError(f"文件大小不一致：{url} (应为 {size} 字节，服务器返回 {total_size} 字节)")
+        hasher = hashlib.sha1()
+        if sha1 and resume_from:
+            # 续传时先把已下载的部分计入哈希
+            hash_start = time.perf_counter()
+            remaining = resume_from
+            with open(part_path, 'rb') as f:
+                while remaining:
+                    chunk = f.read(min(1024 * 1024, remaining))
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    remaining -= len(chunk)
+            record.hash += time.perf_counter() - hash_start
+        state = {"downloaded": resume_from}
         start_time = time.time()
+
+        def on_data(data):
+            self.pause_event.wait()  # 检查是否需要暂停
+            self._raise_if_cancelled()
+            t0 = time.perf_counter()
+            self.bandwidth_limiter.consume(len(data), priority, self.cancel_event)
+            t1 = time.perf_counter()
+            if sha1:
+                hasher.update(data)
+            t2 = time.perf_counter()
+            state["downloaded"] += len(data)
+            if progress_callback and total_size > 0:
+                downloaded_size = state["downloaded"]
+                elapsed_time = time.time() - start_time
+                speed = (downloaded_size - resume_from) / elapsed_time if elapsed_time > 0 else 0
+                progress = (downloaded_size / total_size) * 100
+                progress_callback(progress, speed, downloaded_size, total_size)
+            record.throttle += t1 - t0
+            record.hash += t2 - t1
+            record.callback += time.perf_counter() - t2
+
+        transfer_start = time.perf_counter()
+        self._track(response)
+        try:
+            with response:
+                # 请求时已要求不压缩；不解码时 readinto 直接从连接读取，
+                # 不经过 urllib3 的内部缓冲，连接中断时最多丢失一次读取的数据
+                response.raw.decode_content = False
+                downloaded_size = write_stream(response.raw, part_path, resume_from, total_size, on_data, record,
+                                               self.bandwidth_limiter.max_chunk)
+        except Exception:
+            # 取消时连接被强制关闭，读取会出错，统一报告为取消
+            self._raise_if_cancelled()
+            raise
+        finally:
+            self._untrack(response)
+        self._raise_if_cancelled()
+        record.transfer += time.perf_counter() - transfer_start
+        record.bytes += downloaded_size - resume_from
         
-        with open(target_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                self.pause_event.wait()  # 检查是否需要暂停
-                if chunk:
+        if total_size and downloaded_size != total_size:
+            # 保留 .part，下次从断点继续
+            raise IncompleteDownloadError(f"下载不完整：{url} ({downloaded_size}/{total_size} 字节)")
+        if sha1:
+            actual = hasher.hexdigest()
+            if actual != sha1:
+                self._discard(part_path)
+                raise VerificationError(f"文件校验失败：{url} (sha1 应为 {sha1}，实际为 {actual})")
+        finish_part(part_path, target_path)
+        if sha1:
+            self.verified_index.record(target_path, sha1)
+        return True
+
+    def fetch_file(self, url, target_path, progress_callback=None, sha1=None, size=None, priority=PRIORITY_ASSETS):
+        """从镜像池下载文件
+
+        url 为官方地址，会依次换算成各镜像上的地址。大文件分段从多个镜像同时下载。
+        网络错误按 retry_policy 退避重试（从 .part 续传），仍失败或主机已熔断时换下一个镜像。
+        """
+        candidates = self.mirror_pool.candidates(url)
+        # 熔断中的主机不参与本次下载（也不用于分段）；全部熔断时保持原样，由下面报告 CircuitOpenError
+        candidates = [(mirror, mirror_url) for mirror, mirror_url in candidates
+                      if not self.circuit_breaker.is_open(urlparse(mirror_url).netloc)] or candidates
+        part_path = target_path + ".part"
+        # 已有 .part 时交给 download_file 续传，不再分段
+        if size and size >= SEGMENT_THRESHOLD and len(candidates) > 1 and not os.path.exists(part_path):
+            try:
+                return self._download_segmented(candidates, target_path, progress_callback, sha1, size, priority)
+            except DownloadCancelled:
+                raise  # 保留 .part，下次整文件续传
+            except Exception as e:
+                self._discard(part_path)
+                print(f"[WARN] 分段下载失败，改为整文件下载：{e}")
+
+        last_error = None
+        tries = 0
+        for mirror, mirror_url in candidates:
+            host = urlparse(mirror_url).netloc
+            for retry in range(self.retry_policy.attempts):
+                if not self.circuit_breaker.allow(host):
+                    last_error = last_error or CircuitOpenError(f"{host} 暂时不可用")
+                    break
+                try:
+                    # 之前失败的次数（含换镜像）计入 retries
+                    with self.metrics.transfer(mirror_url, mirror["name"], tries) as record:
+                        queued = time.perf_counter()
+                        with self._host_slot(mirror_url):
+                            record.queue = time.perf_counter() - queued
+                            start_time = time.time()
+                            self.download_file(mirror_url, target_path, progress_callback, sha1, size, priority)
+                            elapsed = time.time() - start_time
+                except DownloadCancelled:
+                    # 熔断后的试探请求被取消时不能一直占着试探名额
+                    self.circuit_breaker.release(host)
+                    raise
+                except Exception as e:
+                    tries += 1
+                    last_error = e
+                    self.mirror_pool.report_failure(mirror)
+                    if not is_retryable(e):
+                        # 主机有正常响应（404、校验失败等），只换镜像，不计入熔断
+                        self.circuit_breaker.record_success(host)
+                        print(f"[WARN] 镜像 {mirror['name']} 下载失败，尝试下一个镜像：{e}")
+                        break
+                    self.circuit_breaker.record_failure(host)
+                    if retry + 1 < self.retry_policy.attempts:
+                        if self.cancel_event.wait(self.retry_policy.delay(retry)):
+                            self._raise_if_cancelled()
+                    else:
+                        print(f"[WARN] 镜像 {mirror['name']} 重试 {retry + 1} 次仍失败，尝试下一个镜像：{e}")
+                    continue
+                self.circuit_breaker.record_success(host)
+                self.mirror_pool.report_success(mirror)
+                if self.bandwidth_limiter.rate <= 0:
+                    # 限速时测到的是限速器的速度，不计入镜像评分
+                    self.mirror_scores.record_transfer(mirror, os.path.getsize(target_path), elapsed)
+                return True
+        raise last_error
+
+    def _fetch_range(self, url, part_path, segment, on_bytes, priority=PRIORITY_ASSETS):
+        """下载 segment = [当前位置, 结束位置] 的字节范围并写入 .part 的对应位置"""
+        start, end = segment
+        record = current_transfer()
+        setup_before = record.dns + record.connect + record.tls
+        request_start = time.perf_counter()
+        response = get_download_session().get(url, stream=True, headers={"Range": f"bytes={start}-{end}", **IDENTITY_ENCODING})
+        record.ttfb += time.perf_counter() - request_start - (record.dns + record.connect + record.tls - setup_before)
+        transfer_start = time.perf_counter()
+        self._track(response)
+        try:
+            self._write_range(response, url, part_path, segment, on_bytes, priority, record)
+        except Exception:
+            self._raise_if_cancelled()
+            raise
+        finally:
+            self._untrack(response)
+        self._raise_if_cancelled()
+        record.transfer += time.perf_counter() - transfer_start
+        if segment[0] <= end:
+            raise IncompleteDownloadError(f"分段下载不完整：{url} ({start}-{end})")
+
+    def _write_range(self, response, url, part_path, segment, on_bytes, priority, record):
+        start, end = segment
+        with response:
+            content_range = response.headers.get('content-range', '')
+            if response.status_code != 206 or not content_range.startswith(f"bytes {start}-"):
+                raise Exception(f"{url} 不支持分段下载 (HTTP {response.status_code})")
+            _require_identity(response, url)
+            with open(part_path, 'r+b') as f:
+                f.seek(start)
+                for chunk in response.iter_content(chunk_size=65536):
+                    self.pause_event.wait()
+                    self._raise_if_cancelled()
+                    if not chunk:
+                        continue
+                    chunk = chunk[:end + 1 - segment[0]]
+                    t0 = time.perf_counter()
+                    self.bandwidth_limiter.consume(len(chunk), priority, self.cancel_event)
+                    t1 = time.perf_counter()
                     f.write(chunk)
-                    downloaded_size += len(chunk)
-                    
-                    if progress_callback and total_size > 0:
-                        elapsed_time = time.time() - start_time
-                        speed = downloaded_size / elapsed_time if elapsed_time > 0 else 0
-                        progress = (downloaded_size / total_size) * 100
-                        progress_callback(progress, speed, downloaded_size, total_size)
-        
+                    record.throttle += t1 - t0
+                    record.disk += time.perf_counter() - t1
+                    record.bytes += len(chunk)
+                    segment[0] += len(chunk)
+                    on_bytes(len(chunk))
+                    if segment[0] > end:
+                        break
+
+    def _download_segmented(self, candidates, target_path, progress_callback, sha1, size, priority=PRIORITY_ASSETS):
+        """把文件分成若干字节范围，轮流分配给各镜像并行下载"""
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        part_path = target_path + ".part"
+        count = min(len(candidates) * SEGMENTS_PER_MIRROR, math.ceil(size / SEGMENT_MIN_SIZE))
+        step = math.ceil(size / count)
+        segments = [[start, min(start + step, size) - 1] for start in range(0, size, step)]
+        with open(part_path, 'wb') as f:
+            preallocate(f, size)
+
+        state = {"bytes": 0}
+        state_lock = Lock()
+        start_time = time.time()
+
+        def on_bytes(n):
+            with state_lock:
+                state["bytes"] += n
+                if progress_callback:
+                    elapsed_time = time.time() - start_time
+                    speed = state["bytes"] / elapsed_time if elapsed_time > 0 else 0
+                    progress_callback(state["bytes"] / size * 100, speed, state["bytes"], size)
+
+        def fetch_segment(index, segment):
+            last_error = None
+            # 第 i 段优先使用第 i 个镜像，失败后从断点换下一个镜像继续
+            for offset in range(len(candidates)):
+                mirror, mirror_url = candidates[(index + offset) % len(candidates)]
+                host = urlparse(mirror_url).netloc
+                if not self.circuit_breaker.allow(host):
+                    last_error = last_error or CircuitOpenError(f"{host} 暂时不可用")
+                    continue
+                try:
+                    with self.metrics.transfer(mirror_url, mirror["name"], offset) as record:
+                        queued = time.perf_counter()
+                        with self._host_slot(mirror_url):
+                            record.queue = time.perf_counter() - queued
+                            self._fetch_range(mirror_url, part_path, segment, on_bytes, priority)
+                    self.circuit_breaker.record_success(host)
+                    self.mirror_pool.report_success(mirror)
+                    return
+                except DownloadCancelled:
+                    self.circuit_breaker.release(host)
+                    raise
+                except Exception as e:
+                    last_error = e
+                    if is_retryable(e):
+                        self.circuit_breaker.record_failure(host)
+                    else:
+                        self.circuit_breaker.record_success(host)
+                    self.mirror_pool.report_failure(mirror)
+            raise last_error
+
+        try:
+            with ThreadPoolExecutor(max_workers=len(segments)) as executor:
+                for future in [executor.submit(fetch_segment, i, seg) for i, seg in enumerate(segments)]:
+                    future.result()
+        except DownloadCancelled:
+            # 各段是分散写入的，只有从开头起连续完成的部分可以续传
+            prefix = next((segment[0] for segment in segments if segment[0] <= segment[1]), size)
+            mark_resumable(part_path, prefix)
+            raise
+
+        # .part 只是临时路径，直接计算哈希，不记入校验索引（改名后记录目标路径）
+        if sha1 and sha1_file(part_path) != sha1:
+            self._discard(part_path)
+            raise VerificationError(f"文件校验失败：{target_path}")
+        finish_part(part_path, target_path)
+        if sha1:
+            self.verified_index.record(target_path, sha1)
         return True
+
+    def _discard(self, path):
+        discard_part(path)
     
+    def _host_slot(self, url):
+        """获取某个主机的并发限制信号量"""
+        host = urlparse(url).netloc
+        with self._host_slots_lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = BoundedSemaphore(self.per_host_limit)
+                self._host_slots[host] = slot
+                # 连接池至少要能容纳该主机的并发数，否则多余的连接会被丢弃重建
+                set_host_pool_size(host, self.per_host_limit)
+            return slot
+
+    def execute_plan(self, plan, progress_callback=None, on_critical_ready=None, progress=None, journal_run=None):
+        """使用线程池并发执行下载计划
+
+        进度回调沿用 download_file 的参数格式 (percent, speed, current, total)，
+        其中 current/total 为整个计划已下载/总字节数。也可以传入自己创建的
+        PlanProgress 并定时采样。启动必需的文件（客户端和库文件）优先调度，
+        全部完成后调用 on_critical_ready。有文件失败时在其余文件完成后抛出 DownloadFailed；
+        调用 cancel_download() 后尽快抛出 DownloadCancelled。给出 journal_run 时记录每个文件的状态。
+        """
+        if progress is None:
+            progress = PlanProgress(plan.total_size, progress_callback, len(plan))
+        jobs = plan.ordered()
+        critical = {"left": len(plan.critical_jobs())}
+        critical_lock = Lock()
+        if on_critical_ready and critical["left"] == 0:
+            on_critical_ready()
+        if not jobs:
+            if progress_callback:
+                progress_callback(100, 0, 0, 0)
+            return True
+
+        def worker(job):
+            self.pause_event.wait()  # 暂停时不开始新的文件
+            self._raise_if_cancelled()
+            if journal_run:
+                journal_run.mark(job, JOB_ACTIVE)
+            try:
+                self.fetch_file(job.url, job.path, progress.file_callback(job), job.sha1, job.size, job.priority)
+            except DownloadCancelled:
+                if journal_run:
+                    journal_run.mark(job, JOB_PENDING)
+                raise
+            except Exception:
+                if journal_run:
+                    journal_run.mark(job, JOB_FAILED)
+                raise
+            if job.sha1:
+                self.object_store.add(job.path, job.sha1)
+            if journal_run:
+                journal_run.mark(job, JOB_DONE)
+            progress.file_done(job, os.path.getsize(job.path))
+            if job.priority == PRIORITY_CRITICAL:
+                with critical_lock:
+                    critical["left"] -= 1
+                    ready = critical["left"] == 0
+                if ready and on_critical_ready:
+                    on_critical_ready()
+
+        # 单个文件重试后仍失败时继续下载其余文件，最后统一报告失败的文件
+        failures = []
+        executor = ThreadPoolExecutor(max_workers=min(self.max_workers, len(jobs)))
+        try:
+            futures = {executor.submit(worker, job): job for job in jobs}
+            pending = set(futures)
+            while pending:
+                # 定时醒来检查取消，不必等正在进行的文件全部结束
+                done, pending = wait(pending, timeout=CANCEL_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                if self.cancel_event.is_set():
+                    raise DownloadCancelled("下载已取消")
+                for future in done:
+                    error = future.exception()
+                    if error is not None:
+                        failures.append((futures[future], error))
+        finally:
+            # 取消时丢弃尚未开始的文件，正在进行的传输已被 cancel_download 中断
+            executor.shutdown(wait=not self.cancel_event.is_set(), cancel_futures=True)
+        if failures:
+            raise DownloadFailed(failures)
+        return True
+
     def pause_download(self):
         """暂停下载"""
         self.pause_event.clear()
+
+    def cancel_download(self):
+        """取消下载：立即关闭正在进行的连接，execute_plan 随即抛出 DownloadCancelled
+
+        已下载的 .part 保留用于续传。取消后该下载器不能再次使用。
+        """
+        self.cancel_event.set()
+        self.pause_event.set()  # 唤醒暂停中的线程，让它们看到取消
+        self.bandwidth_limiter.wake()  # 唤醒等待限速额度的线程
+        with self._active_lock:
+            responses = list(self._active_responses)
+        for response in responses:
+            # 直接关闭套接字，阻塞在 recv 中的线程会立刻返回，而不是等到读超时
+            sock = getattr(getattr(response.raw, "_connection", None), "sock", None)
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def _raise_if_cancelled(self):
+        if self.cancel_event.is_set():
+            raise DownloadCancelled("下载已取消")
+
+    def _track(self, response):
+        with self._active_lock:
+            self._active_responses.add(response)
+
+    def _untrack(self, response):
+        with self._active_lock:
+            self._active_responses.discard(response)
     
     def resume_download(self):
         """继续下载"""
         self.pause_event.set()
+
+    def set_speed_limit(self, bytes_per_second):
+        """设置全局下载限速（字节/秒），0 表示不限速"""
+        self.bandwidth_limiter.set_rate(bytes_per_second)
     
-    def verify_file(self, file_path, expected_hash):
-        """验证文件完整性"""
-        if not os.path.exists(file_path):
+    def verify_file(self, file_path, expected_hash, stat=None):
+        """验证文件完整性（文件未变化时直接使用已校验索引中的结果）
+
+        stat 为调用方已知的 (大小, 修改时间ns)，给出时不再访问磁盘查询索引。
+        """
+        if stat is not None:
+            if self.verified_index.lookup_stat(file_path, *stat) == expected_hash:
+                return True
+        elif not os.path.exists(file_path):
             return False
+        elif self.verified_index.lookup(file_path) == expected_hash:
+            return True
         
-        sha1 = hashlib.sha1()
-        with open(file_path, 'rb') as f:
-            for chunk in iter(lambda: f.read(4096), b''):
-                sha1.update(chunk)
-        return sha1.hexdigest() == expected_hash
+        if sha1_file(file_path) != expected_hash:
+            self.verified_index.forget(file_path)
+            return False
+        self.verified_index.record(file_path, expected_hash)
+        return True
+
+    def is_file_complete(self, file_path, sha1=None, size=None, presence=None):
+        """判断本地文件是否完整：大小一致且 sha1 校验通过
+
+        presence 为覆盖该路径的 PresenceIndex 时，直接使用扫描结果而不逐个 stat。
+        """
+        if presence is not None and presence.covers(file_path):
+            stat = presence.get(file_path)
+            if stat is None:
+                return False
+        else:
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                return False
+            stat = (st.st_size, st.st_mtime_ns)
+        if size is not None and stat[0] != size:
+            return False
+        if sha1:
+            return self.verify_file(file_path, sha1, stat)
+        return True
     
-    def download_version(self, version, progress_callback=None):
-        """下载指定版本的游戏文件"""
+    def _save_version_json(self, version, version_info):
+        """保存版本 JSON，启动时需要用到"""
+        version_json_path = os.path.join(self.versions_dir, version, f"{version}.json")
+        if not os.path.exists(version_json_path):
+            os.makedirs(os.path.dirname(version_json_path), exist_ok=True)
+            with open(version_json_path, 'w') as f:
+                json.dump(version_info, f)
+
+    def _require_version_info(self, version):
         version_info = self.get_version_info(version)
         if not version_info:
             raise Exception(f"找不到版本 {version} 的信息")
-        
-        # 下载客户端
+        return version_info
+
+    def _plan_add(self, plan, job, presence=None):
+        """本地已有或共享仓库中已有的文件直接跳过，其余加入下载计划"""
+        if self.is_file_complete(job.path, job.sha1, job.size, presence):
+            plan.skipped += 1
+        elif job.sha1 and self.object_store.materialize(job.sha1, job.path, job.size):
+            # materialize 只链接校验通过的对象，目标与对象内容相同
+            self.verified_index.record(job.path, job.sha1)
+            plan.skipped += 1
+        else:
+            plan.add(job)
+
+    def plan_version(self, version, plan=None):
+        """规划客户端和库文件的下载，返回 DownloadPlan"""
+        plan = plan if plan is not None else DownloadPlan()
+        version_info = self._require_version_info(version)
+        self._save_version_json(version, version_info)
+        # 资源索引很小，规划阶段直接下载
+        self.get_asset_index(version_info)
+
+        # 一次扫描得到所有已有文件，之后只在内存中比对
+        presence = PresenceIndex([self.libraries_dir, os.path.join(self.versions_dir, version)])
+        client = version_info["downloads"]["client"]
         client_path = os.path.join(self.versions_dir, version, f"{version}.jar")
-        if not os.path.exists(client_path):
-            # Use the current mirror base URL for client download
-            client_url = urljoin(self.current_mirror['base'], version_info["downloads"]["client"]["url"].split('launchermeta.mojang.com/')[-1])
-            self.download_file(client_url, client_path, progress_callback)
-        
-        # 下载资源文件
-        assets_index = version_info["assetIndex"]
-        assets_index_path = os.path.join(self.assets_dir, "indexes", f"{assets_index['id']}.json")
-        if not os.path.exists(assets_index_path):
-            self.download_file(assets_index["url"], assets_index_path, progress_callback)
-        
-        # 下载库文件
-        libraries = version_info["libraries"]
-        total_libraries = len(libraries)
-        for i, library in enumerate(libraries):
-            if "downloads" not in library:
+        self._plan_add(plan, DownloadJob(client["url"], client_path, client.get("sha1"), client.get("size"), "client"), presence)
+
+        for library in version_info["libraries"]:
+            if "downloads" not in library or not rules_allow(library.get("rules")):
                 continue
-                
-            artifact = library["downloads"].get("artifact")
-            if artifact:
-                path = os.path.join(self.libraries_dir, artifact["path"])
-                if not os.path.exists(path):
-                    # Use the current mirror base URL for library download
-                    library_url = urljoin(self.current_mirror['base'], artifact['url'].split('libraries.minecraft.net/')[-1])
-                    self.download_file(library_url, path, progress_callback)
-        
-        return True
+            # 普通库文件和当前系统的 natives（旧版本放在 classifiers 中）
+            for artifact in (library["downloads"].get("artifact"), native_artifact(library)):
+                if artifact:
+                    path = os.path.join(self.libraries_dir, artifact["path"])
+                    self._plan_add(plan, DownloadJob(artifact["url"], path, artifact.get("sha1"), artifact.get("size"), "library"), presence)
+        return plan
+
+    def plan_assets(self, version, plan=None):
+        """规划资源文件的下载，返回 DownloadPlan"""
+        plan = plan if plan is not None else DownloadPlan()
+        version_info = self._require_version_info(version)
+        assets_data = self.get_asset_index(version_info)
+        presence = PresenceIndex([os.path.join(self.assets_dir, "objects")])
+        seen = set()
+        for asset_info in assets_data["objects"].values():
+            hash = asset_info["hash"]
+            if hash in seen:
+                continue  # 多个资源可能共享同一个对象
+            seen.add(hash)
+            path = os.path.join(self.assets_dir, "objects", hash[:2], hash)
+            asset_url = f"{ASSETS_BASE_URL}{hash[:2]}/{hash}"
+            self._plan_add(plan, DownloadJob(asset_url, path, hash, asset_info.get("size"), "asset"), presence)
+        return plan
+
+    def run_plan(self, plan, progress_callback=None, on_critical_ready=None, progress=None, journal_run=None):
+        """执行下载计划，结束后保存校验索引和镜像评分，并在日志中记录结果"""
+        state = RUN_FAILED  # 失败的下载之后仍可以从日志恢复
+        try:
+            result = self.execute_plan(plan, progress_callback, on_critical_ready, progress, journal_run)
+            state = RUN_DONE
+            return result
+        except DownloadCancelled:
+            state = RUN_CANCELLED
+            raise
+        finally:
+            self.save_indexes()
+            self.mirror_scores.save()
+            if journal_run:
+                journal_run.finish(state)
+
+    def save_indexes(self):
+        """保存本实例和共享仓库的校验索引"""
+        self.verified_index.save()
+        self.object_store.save()
+
+    def plan_from_journal(self, journal, run_id):
+        """从下载日志恢复未完成的文件；崩溃前可能已完成但未记录的文件在这里被跳过"""
+        plan = DownloadPlan()
+        for job in journal.load_plan(run_id).jobs:
+            self._plan_add(plan, job)
+        return plan
+
+    def download_version(self, version, progress_callback=None):
+        """下载指定版本的游戏文件"""
+        try:
+            plan = self.plan_version(version)
+        finally:
+            self.save_indexes()
+        return self.run_plan(plan, progress_callback)
     
     def download_assets(self, version, progress_callback=None):
         """下载资源文件"""
-        version_info = self.get_version_info(version)
-        if not version_info:
-            raise Exception(f"找不到版本 {version} 的信息")
-        
-        assets_index = version_info["assetIndex"]
-        assets_index_path = os.path.join(self.assets_dir, "indexes", f"{assets_index['id']}.json")
-        
-        with open(assets_index_path, 'r') as f:
-            assets_data = json.load(f)
-        
-        total_assets = len(assets_data["objects"])
-        downloaded_assets = 0
-        
-        for asset_id, asset_info in assets_data["objects"].items():
-            hash = asset_info["hash"]
-            path = os.path.join(self.assets_dir, "objects", hash[:2], hash)
-            
-            if not os.path.exists(path):
-                # Use the current mirror base URL for asset download
-                asset_url = urljoin(self.current_mirror['base'], f"assets/{hash[:2]}/{hash}")
-                self.download_file(asset_url, path, progress_callback)
-            
-            downloaded_assets += 1
-            if progress_callback:
-                progress = (downloaded_assets / total_assets) * 100
-                progress_callback(progress, 0, downloaded_assets, total_assets)
-        
-        return True 
\ No newline at end of file
+        try:
+            plan = self.plan_assets(version)
+        finally:
+            self.save_indexes()
+        return self.run_plan(plan, progress_callback)
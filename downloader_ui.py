@@ -1,39 +1,68 @@
-from PyQt5.QtCore import QThread, pyqtSignal
+import os
+from PyQt5.QtCore import QThread, QTimer, pyqtSignal
 from PyQt5.QtWidgets import QMessageBox # 需要QMessageBox来显示下载完成/失败消息
-from downloader import MinecraftDownloader # 需要MinecraftDownloader类
+from downloader import MinecraftDownloader, DownloadCancelled # 需要MinecraftDownloader类
+from download_journal import DownloadJournal, JournalRun, RUN_DISMISSED
+from download_planner import DownloadPlan, PlanProgress
+from progress_bus import ProgressAggregator
+from object_store import ObjectStore
+from bandwidth import get_bandwidth_limiter
 
 class DownloadThread(QThread):
-    progress = pyqtSignal(str, float, float)  # 状态文本, 百分比, 速度
+    status = pyqtSignal(str)  # 状态文本（规划阶段等）
+    progress = pyqtSignal(object)  # 合并后的进度更新 ProgressUpdate，最多每秒 10 次
     finished = pyqtSignal(bool, str)
     finished_successfully = pyqtSignal() # 添加下载成功信号
+    critical_ready = pyqtSignal() # 启动必需的文件已下载完成，可以启动游戏
+    cancelled = pyqtSignal() # 用户取消了下载
     
-    def __init__(self, downloader, version, queue):
+    def __init__(self, downloader, version, queue, journal=None, resume_run=None):
         super().__init__()
         self.downloader = downloader
         self.version = version
         self.queue = queue
+        self.journal = journal # 下载日志，用于崩溃或关闭后继续下载
+        self.resume_run = resume_run # 要继续的日志记录 id，为 None 时重新规划
         self._running = True # 这个变量在原代码中没有被使用，先保留
     
     def run(self):
         try:
-            for task in self.queue:
-                if task == 'version':
-                    self.progress.emit("正在下载游戏主程序...", 0, 0)
-                    self.downloader.download_version(self.version, self.progress_callback)
-                elif task == 'assets':
-                    self.progress.emit("正在下载资源文件...", 0, 0)
-                    self.downloader.download_assets(self.version, self.progress_callback)
+            if self.resume_run is not None:
+                # 从日志恢复时只检查剩余的文件，不必重新规划整个版本
+                self.status.emit("正在检查未完成的文件...")
+                plan = self.downloader.plan_from_journal(self.journal, self.resume_run)
+                journal_run = JournalRun(self.journal, self.resume_run)
+            else:
+                # 先规划整个队列，得到总字节数后再统一下载
+                self.status.emit("正在计算需要下载的文件...")
+                plan = DownloadPlan()
+                for task in self.queue:
+                    if task == 'version':
+                        self.downloader.plan_version(self.version, plan)
+                    elif task == 'assets':
+                        self.downloader.plan_assets(self.version, plan)
+                journal_run = None
+                if self.journal is not None and len(plan):
+                    run_id = self.journal.create_run(self.version, self.downloader.game_dir, self.queue, plan)
+                    journal_run = JournalRun(self.journal, run_id)
+            self.status.emit(f"共需下载 {len(plan)} 个文件 ({plan.total_size/1024/1024:.1f} MB)，已跳过 {plan.skipped} 个")
+            # 下载线程只更新计数，由聚合器定时采样后发信号，避免逐块刷新界面
+            progress = PlanProgress(plan.total_size, total_files=len(plan))
+            aggregator = ProgressAggregator(progress, self.progress.emit)
+            aggregator.start()
+            try:
+                self.downloader.run_plan(plan, on_critical_ready=self.critical_ready.emit, progress=progress, journal_run=journal_run)
+            finally:
+                aggregator.stop()
             self.finished.emit(True, "下载完成！")
             self.finished_successfully.emit() # 下载成功时发射信号
+        except DownloadCancelled:
+            self.cancelled.emit()
         except Exception as e:
             self.finished.emit(False, f"下载失败：{str(e)}")
-    
-    def progress_callback(self, percent, speed, current, total):
-        text = f"进度: {percent:.2f}%  速度: {speed/1024:.2f} KB/s ({current}/{total}字节)"
-        self.progress.emit(text, percent, speed)
 
 class DownloadManagerUI:
-    def __init__(self, status_label, progress_bar, download_button, pause_button, dir_input, download_version_combo, download_queue, main_window, mirror_label, config_manager):
+    def __init__(self, status_label, progress_bar, download_button, pause_button, dir_input, download_version_combo, download_queue, main_window, mirror_label, config_manager, speed_limit_input=None, cancel_button=None):
         self.status_label = status_label
         self.progress_bar = progress_bar
         self.download_button = download_button
@@ -45,10 +74,57 @@ class DownloadManagerUI:
         self.is_paused = False # 添加is_paused属性
         self.mirror_label = mirror_label # 添加镜像标签
         self.config_manager = config_manager # Add config_manager attribute
+        self.speed_limit_input = speed_limit_input # 限速输入框（KB/s，0 为不限速）
+        self.cancel_button = cancel_button # 取消下载按钮
+        self.journal = None # 当前游戏目录的下载日志
 
         # 连接信号
         self.download_button.clicked.connect(self.download_game)
         self.pause_button.clicked.connect(self.pause_or_resume)
+        if self.speed_limit_input is not None:
+            config = self.config_manager.load_config()
+            self.speed_limit_input.setValue(int(config.get('speed_limit', 0) or 0))
+            get_bandwidth_limiter().set_rate(self.speed_limit_input.value() * 1024)
+            self.speed_limit_input.valueChanged.connect(self.change_speed_limit)
+        if self.cancel_button is not None:
+            self.cancel_button.setEnabled(False)
+            self.cancel_button.clicked.connect(self.cancel_download)
+        # 界面显示后再检查上次未完成的下载
+        QTimer.singleShot(0, self.check_unfinished_downloads)
+
+    def get_journal(self, versions_base_dir):
+        """打开游戏目录下的下载日志（.pmcl/journal.db）"""
+        path = os.path.join(versions_base_dir, '.pmcl', 'journal.db')
+        if self.journal is not None and self.journal.path != path:
+            self.journal.close()
+            self.journal = None
+        if self.journal is None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.journal = DownloadJournal(path)
+        return self.journal
+
+    def check_unfinished_downloads(self):
+        """启动时询问是否继续上次中断的下载"""
+        versions_base_dir = self.dir_input.text()
+        if not versions_base_dir or not os.path.exists(os.path.join(versions_base_dir, '.pmcl', 'journal.db')):
+            return
+        try:
+            journal = self.get_journal(versions_base_dir)
+            runs = journal.unfinished_runs()
+        except Exception as e:
+            print(f"[WARN] 读取下载日志失败：{e}")
+            return
+        for run in runs:
+            answer = QMessageBox.question(
+                self.main_window, "继续下载",
+                f"版本 {run['version']} 上次的下载没有完成，还剩 {run['remaining']} 个文件"
+                f"（{run['remaining_bytes']/1024/1024:.1f} MB）。\n是否继续下载？",
+                QMessageBox.Yes | QMessageBox.No,
+            )
+            if answer == QMessageBox.Yes:
+                self.start_download(run['version'], run['game_dir'], run['tasks'], versions_base_dir, resume_run=run['id'])
+                return # 一次只进行一个下载，其余的下次启动再询问
+            journal.finish_run(run['id'], RUN_DISMISSED)  # 不再询问
 
     def add_to_queue(self, task):
         if task not in self.download_queue:
@@ -58,18 +134,25 @@ class DownloadManagerUI:
             self.status_label.setText(f"任务已在队列: {self.download_queue}")
 
     def download_game(self):
-        game_dir = self.dir_input.text()
+        versions_base_dir = self.dir_input.text()
         version = self.download_version_combo.currentText() # 使用新的版本选择框获取版本
 
-        if not game_dir:
+        if not versions_base_dir:
             QMessageBox.warning(self.main_window, "错误", "请选择游戏目录！")
             return
         if not self.download_queue:
             QMessageBox.warning(self.main_window, "错误", "请先添加下载任务到队列！")
             return
 
+        # 每个版本下载到自己的隔离目录，库文件和资源文件通过共享仓库在各版本间复用
+        game_dir = self.main_window.get_version_game_dir(version)
+        self.start_download(version, game_dir, self.download_queue, versions_base_dir)
+
+    def start_download(self, version, game_dir, queue, versions_base_dir, resume_run=None):
         self.download_button.setEnabled(False)
         self.pause_button.setEnabled(True)
+        if self.cancel_button is not None:
+            self.cancel_button.setEnabled(True)
         self.status_label.setText("准备下载...")
         self.progress_bar.setValue(0)
 
@@ -77,21 +160,39 @@ class DownloadManagerUI:
         config = self.config_manager.load_config()
         mirror_source = config.get('mirror_source', 'https://bmclapi2.bangbang93.com/') # Use default if not in config
 
-        self.downloader = MinecraftDownloader(game_dir, mirror_source) # Pass mirror_source to downloader
-        self.download_thread = DownloadThread(self.downloader, version, self.download_queue)
+        object_store = ObjectStore(os.path.join(versions_base_dir, '.objects'))
+        try:
+            journal = self.get_journal(versions_base_dir)
+        except Exception as e:
+            print(f"[WARN] 无法打开下载日志，本次下载不支持中断后继续：{e}")
+            journal = None
+        self.downloader = MinecraftDownloader(game_dir, mirror_source, object_store=object_store) # Pass mirror_source to downloader
+        self.download_thread = DownloadThread(self.downloader, version, queue, journal, resume_run)
+        self.download_thread.status.connect(self.status_label.setText)
         self.download_thread.progress.connect(self.update_progress)
         self.download_thread.finished.connect(self.download_finished)
+        self.download_thread.cancelled.connect(self.download_cancelled)
         # 连接下载成功信号到主窗口的刷新本地版本列表方法
         self.download_thread.finished_successfully.connect(self.main_window.refresh_local_versions)
+        # 客户端和库文件下载完成后即可启动，不必等待资源文件
+        self.download_thread.critical_ready.connect(self.main_window.refresh_local_versions)
         self.download_thread.start()
 
-    def update_progress(self, message, percent, speed):
-        self.status_label.setText(message)
-        self.progress_bar.setValue(int(percent))
+    def update_progress(self, update):
+        """显示一次合并后的进度（ProgressUpdate）"""
+        text = (f"进度: {update.percent:.2f}%  速度: {update.speed/1024:.2f} KB/s  "
+                f"文件: {update.done_files}/{update.total_files}  "
+                f"({update.current_bytes/1024/1024:.1f}/{update.total_bytes/1024/1024:.1f} MB)")
+        if update.eta is not None and not update.finished:
+            eta = int(update.eta)
+            text += f"  剩余: {eta//60}分{eta%60}秒"
+        if update.active_files and not update.finished:
+            text += "\n正在下载: " + ", ".join(update.active_files)
+        self.status_label.setText(text)
+        self.progress_bar.setValue(int(update.percent))
 
     def download_finished(self, success, message):
-        self.download_button.setEnabled(True)
-        self.pause_button.setEnabled(False)
+        self._reset_buttons()
         self.status_label.setText(message)
         self.download_queue.clear()
 
@@ -100,6 +201,35 @@ class DownloadManagerUI:
         else:
             QMessageBox.warning(self.main_window, "错误", message)
 
+    def download_cancelled(self):
+        self._reset_buttons()
+        self.status_label.setText("下载已取消，下次可以从中断处继续")
+        self.download_queue.clear()
+
+    def _reset_buttons(self):
+        self.download_button.setEnabled(True)
+        self.pause_button.setEnabled(False)
+        self.pause_button.setText("暂停下载")
+        self.is_paused = False
+        if self.cancel_button is not None:
+            self.cancel_button.setEnabled(False)
+
+    def cancel_download(self):
+        """取消当前下载，已下载的部分保留"""
+        if not hasattr(self, 'downloader'):
+            return
+        if self.cancel_button is not None:
+            self.cancel_button.setEnabled(False)
+        self.status_label.setText("正在取消下载...")
+        self.downloader.cancel_download()
+
+    def change_speed_limit(self, kb_per_second):
+        """下载过程中调整限速，并保存到配置"""
+        get_bandwidth_limiter().set_rate(kb_per_second * 1024)
+        config = self.config_manager.load_config()
+        config['speed_limit'] = kb_per_second
+        self.config_manager.save_config(config)
+
     def pause_or_resume(self):
         if not hasattr(self, 'downloader'):
             return
@@ -0,0 +1,142 @@
+import os
+import time
+
+# 自适应读取块大小的范围，以及每次读取期望耗费的时间
+MIN_CHUNK = 64 * 1024
+MAX_CHUNK = 4 * 1024 * 1024
+TARGET_READ_SECONDS = 0.05
+# 大于该大小的文件才预分配空间并记录续传点
+PREALLOCATE_MIN = 1024 * 1024
+# 大文件每写入这么多数据 fsync 一次，并更新续传点
+FSYNC_INTERVAL = 16 * 1024 * 1024
+
+
+def _length_path(part_path):
+    return part_path + ".len"
+
+
+def preallocate(f, size):
+    """为文件预先分配 size 字节，减少机械硬盘上的碎片"""
+    try:
+        os.posix_fallocate(f.fileno(), 0, size)
+    except (AttributeError, OSError):
+        # Windows 等平台：设置文件长度，由文件系统一次分配
+        f.truncate(size)
+
+
+def _write_length(part_path, length):
+    tmp_path = _length_path(part_path) + ".tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(str(length))
+    os.replace(tmp_path, _length_path(part_path))
+
+
+def resume_offset(part_path):
+    """.part 文件中可以续传的字节数
+
+    预分配过的文件长度不代表已下载的长度，以 .len 中记录的、已经 fsync 的长度为准。
+    """
+    try:
+        size = os.path.getsize(part_path)
+    except OSError:
+        return 0
+    try:
+        with open(_length_path(part_path), 'r') as f:
+            return min(int(f.read().strip() or 0), size)
+    except (OSError, ValueError):
+        return size
+
+
+def mark_resumable(part_path, length):
+    """记录 .part 开头已完整写入的 length 字节（先 fsync），之后由 resume_offset 从这里续传"""
+    with open(part_path, 'r+b') as f:
+        os.fsync(f.fileno())
+    _write_length(part_path, length)
+
+
+def discard_part(part_path):
+    for path in (part_path, _length_path(part_path)):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def finish_part(part_path, target_path):
+    """下载完成：把 .part 原子地重命名为目标文件"""
+    os.replace(part_path, target_path)
+    try:
+        os.remove(_length_path(part_path))
+    except OSError:
+        pass
+
+
+def write_stream(raw, part_path, offset=0, expected_size=None, on_data=None, timings=None, chunk_limit=None):
+    """把响应体写入 part_path 的 offset 处，返回写入结束时的文件长度
+
+    使用可复用的缓冲区和 readinto 读取，块大小根据实测速度在 MIN_CHUNK 到
+    MAX_CHUNK 之间调整。on_data 收到每块数据的 memoryview（用于计算哈希、
+    限速和进度），在写入磁盘之前调用。timings 为带 add(name, seconds) 方法的对象
+    （如 TransferRecord），写盘耗时计入其中的 disk。chunk_limit 为返回当前块大小上限
+    （如限速器的桶容量，None 表示不限制）的函数，每次读取前调用。
+    """
+    large = bool(expected_size) and expected_size >= PREALLOCATE_MIN
+    if offset:
+        f = open(part_path, 'r+b')
+        f.seek(offset)
+    else:
+        f = open(part_path, 'wb')
+        if large:
+            preallocate(f, expected_size)
+            _write_length(part_path, 0)
+
+    disk_seconds = 0.0
+    buffer = bytearray(MIN_CHUNK)
+    view = memoryview(buffer)
+    chunk_size = MIN_CHUNK
+    position = offset
+    unsynced = 0
+    try:
+        while True:
+            # 限速时块大小不超过限速器一次能放行的量，否则大块会先突发再长时间停顿
+            limit = chunk_limit() if chunk_limit else None
+            read_size = max(min(chunk_size, limit), MIN_CHUNK) if limit else chunk_size
+            start = time.perf_counter()
+            n = raw.readinto(view[:read_size])
+            elapsed = time.perf_counter() - start
+            if not n:
+                break
+            data = view[:n]
+            if on_data:
+                on_data(data)
+            write_start = time.perf_counter()
+            f.write(data)
+            position += n
+            unsynced += n
+            if large and unsynced >= FSYNC_INTERVAL:
+                f.flush()
+                os.fsync(f.fileno())
+                _write_length(part_path, position)
+                unsynced = 0
+            disk_seconds += time.perf_counter() - write_start
+
+            # 让每次读取大约耗费 TARGET_READ_SECONDS，链路越快块越大
+            if n == read_size and elapsed > 0:
+                wanted = n / elapsed * TARGET_READ_SECONDS
+                chunk_size = MIN_CHUNK
+                while chunk_size < wanted and chunk_size < MAX_CHUNK:
+                    chunk_size *= 2
+                if chunk_size > len(buffer):
+                    buffer = bytearray(chunk_size)
+                    view = memoryview(buffer)
+    finally:
+        write_start = time.perf_counter()
+        if large:
+            f.truncate(position)
+            f.flush()
+            os.fsync(f.fileno())
+            _write_length(part_path, position)
+        f.close()
+        if timings is not None:
+            timings.add("disk", disk_seconds + time.perf_counter() - write_start)
+    return position
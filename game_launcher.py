@@ -1,60 +1,105 @@
 import os
+import time
 import subprocess
 from PyQt5.QtWidgets import QMessageBox
+from launch_builder import LaunchBuilder, LaunchError
+from instance_check import InstanceVerifier
+from jvm_tuning import AUTO, tune, detect_hardware, get_java_probe_cache
+from cds_archive import CdsArchives, MODE_SHARED, watch_startup
+from page_cache_warmup import hot_assets, warm_in_background
 
 class GameLauncher:
-    def __init__(self):
-        pass
+    def __init__(self, game_dir, builder=None, verifier=None, cds=None):
+        self.game_dir = game_dir
+        # 生成启动命令；解析结果按版本 JSON、Java 路径和参数缓存，重复启动直接复用
+        self.builder = builder or LaunchBuilder(game_dir)
+        # 启动前检查文件完整性；实例未变化时直接跳过
+        self.verifier = verifier or InstanceVerifier(game_dir, self.builder)
+        self.cds = cds or CdsArchives()
 
-    def launch_game(self, current_profile, game_dir, version, memory_combo, memory_input, java_path):
+    def launch_game(self, version, java_path, current_profile, memory=None, preset=AUTO, use_cds=False, warmup=True):
+        """启动游戏；memory 为 None 时由 JVM 预设根据本机内存决定堆大小
+
+        use_cds 时为 版本 + Java + 模组组合 生成并使用 AppCDS 存档，并记录启动耗时。
+        warmup 时在 JVM 启动的同时预读 classpath 中的 jar、natives 和启动用到的资源文件。
+        """
         if not current_profile:
             QMessageBox.warning(None, "错误", "请先登录！")
             return
-            
-        if not game_dir:
+
+        if not self.game_dir:
             QMessageBox.warning(None, "错误", "请选择游戏目录！")
             return
-            
-        jar_path = os.path.join(game_dir, "versions", version, f"{version}.jar")
-        if not os.path.exists(jar_path):
-            QMessageBox.warning(None, "错误", f"未找到 {jar_path}，请先下载！")
+
+        java = get_java_probe_cache().probe(java_path)
+        try:
+            tuning = tune(preset, detect_hardware(), java, {"max_memory": memory} if memory else None)
+        except ValueError as e:
+            QMessageBox.warning(None, "错误", str(e))
             return
-        
-        # 获取内存参数
-        memory = memory_combo.currentText()
-        if memory == "自定义":
-            memory = memory_input.text().strip()
-            if not memory:
-                QMessageBox.warning(None, "错误", "请输入自定义内存大小，如 6G 或 4096M")
+        print("JVM 参数：", tuning.describe())
+
+        try:
+            check = self.verifier.check(version)
+            if not check.ok:
+                details = "\n".join(check.problems[:5])
+                QMessageBox.warning(None, "错误", f"有 {len(check.problems)} 个文件缺失或损坏，请重新下载版本：\n{details}")
                 return
-        
-        game_args = [
-            java_path,
-            f"-Xmx{memory}",  # 最大内存
-            "-XX:+UnlockExperimentalVMOptions",
-            "-XX:+UseG1GC",
-            "-XX:G1NewSizePercent=20",
-            "-XX:G1ReservePercent=20",
-            "-XX:MaxGCPauseMillis=50",
-            "-XX:G1HeapRegionSize=32M",
-            "-jar", jar_path,
-            "--username", current_profile["name"],
-            "--uuid", current_profile["uuid"],
-            "--gameDir", game_dir,
-            "--assetsDir", os.path.join(game_dir, "assets"),
-            "--assetIndex", version
-        ]
-        
-        # 添加认证信息
-        if current_profile["type"] != "offline":
-            game_args.extend([
-                "--accessToken", current_profile["access_token"]
-            ])
-        
-        print("Attempting to launch game with args:", game_args)
+            if not check.fast:
+                print(f"启动前检查：{len(check.changed)} 个目录有变化，检查了 {check.checked} 个文件，用时 {check.seconds:.2f} 秒")
+            plan = self.builder.plan(version, java_path)
+        except LaunchError as e:
+            QMessageBox.warning(None, "错误", str(e))
+            return
+        jvm_args = list(tuning.args)
+        cds = None
+        if use_cds:
+            cds = self.cds.prepare(java_path, java.major, plan.classpath, os.path.join(self.game_dir, "mods"))
+            if cds is None:
+                print(f"Java {java.major or '未知版本'} 不支持动态 CDS 存档（需要 Java 13+），本次不使用")
+            else:
+                jvm_args += cds.args
+        game_args = plan.command(current_profile, jvm_args)
+
+        # 日志中隐藏访问令牌
+        token = current_profile.get("access_token")
+        print("Attempting to launch game with args:", [arg.replace(token, "***") if token else arg for arg in game_args])
+
+        if warmup:
+            warm_in_background(self._warmup_paths(plan), self._report_warmup)
 
         try:
-            subprocess.Popen(game_args)
+            started = time.perf_counter()
+            if cds is None:
+                subprocess.Popen(game_args, cwd=self.game_dir)
+            else:
+                # 游戏输出写入日志文件，从中找到初始化渲染的时间点来统计启动耗时
+                log_path = os.path.join(self.game_dir, "logs", "pmcl-launch.log")
+                os.makedirs(os.path.dirname(log_path), exist_ok=True)
+                with open(log_path, 'wb') as log:
+                    process = subprocess.Popen(game_args, cwd=self.game_dir, stdout=log, stderr=subprocess.STDOUT)
+                print(f"游戏输出：{log_path}")
+                watch_startup(log_path, process, lambda seconds: self._report_startup(cds, seconds), started)
             QMessageBox.information(None, "提示", f"已启动Minecraft {version}")
         except Exception as e:
-            QMessageBox.warning(None, "错误", f"启动失败: {e}") 
\ No newline at end of file
+            QMessageBox.warning(None, "错误", f"启动失败: {e}")
+
+    def _warmup_paths(self, plan):
+        """按 JVM 读取的先后排列：classpath、natives、资源文件"""
+        paths = list(plan.classpath)
+        if plan.natives_dir and os.path.isdir(plan.natives_dir):
+            paths += [entry.path for entry in os.scandir(plan.natives_dir) if entry.is_file()]
+        paths += hot_assets(os.path.join(self.game_dir, "assets"), plan.asset_index)
+        return paths
+
+    @staticmethod
+    def _report_warmup(result):
+        print(f"预读 {result.files} 个文件（{result.bytes/1024/1024:.1f} MB），用时 {result.seconds:.2f} 秒，跳过 {result.skipped} 个")
+
+    def _report_startup(self, cds, seconds):
+        without, with_archive = self.cds.record_startup(cds, seconds)
+        state = "使用 CDS 存档" if cds.mode == MODE_SHARED else "未使用 CDS 存档（退出时生成）"
+        print(f"启动耗时 {seconds:.1f} 秒，{state}")
+        if without and with_archive:
+            saved = without - with_archive
+            print(f"CDS 存档平均节省 {saved:.1f} 秒（{saved / without:.0%}）：未使用 {without:.1f} 秒，使用 {with_archive:.1f} 秒")
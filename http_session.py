@@ -0,0 +1,185 @@
+import time
+import socket
+import threading
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+from transfer_metrics import note_connection
+
+# 默认超时：(连接超时, 读取超时)，单位秒
+DEFAULT_TIMEOUT = (5, 30)
+# 未单独配置的主机使用的连接池大小
+DEFAULT_POOL_SIZE = 10
+# 连接层面的自动重试（只重试幂等请求）；文件下载在 transfer_policy 中另有整体重试
+RETRY_TOTAL = 2
+RETRY_BACKOFF = 0.5
+RETRY_JITTER = 0.5
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+_session = None
+_download_session = None
+_probe_session = None
+_session_lock = threading.Lock()
+_host_pool_sizes = {}
+
+
+class PMCLSession(requests.Session):
+    """带默认超时的 Session，未指定 timeout 的请求自动使用 DEFAULT_TIMEOUT"""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        super().__init__()
+        self.timeout = timeout
+        self.headers["User-Agent"] = "PMCL"
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+class _TimedConnectionMixin:
+    """建立新连接时分别记录域名解析、TCP 连接和 TLS 握手的耗时"""
+
+    def _new_conn(self):
+        host = self._dns_host
+        started = time.perf_counter()
+        try:
+            addresses = socket.getaddrinfo(host, self.port, 0, socket.SOCK_STREAM)
+        except socket.gaierror:
+            # 交给 urllib3 解析并抛出它自己的异常
+            return super()._new_conn()
+        resolved = time.perf_counter()
+        # 逐个尝试解析出的地址，避免 urllib3 再解析一次
+        last_error = None
+        for _, _, _, _, sockaddr in addresses:
+            self._dns_host = sockaddr[0]
+            try:
+                sock = super()._new_conn()
+                break
+            except Exception as e:
+                last_error = e
+            finally:
+                self._dns_host = host
+        else:
+            raise last_error
+        self._setup_seconds = time.perf_counter() - started
+        note_connection(dns=resolved - started, connect=self._setup_seconds - (resolved - started))
+        return sock
+
+    def connect(self):
+        self._setup_seconds = 0.0
+        started = time.perf_counter()
+        super().connect()
+        if isinstance(self, HTTPSConnection):
+            note_connection(tls=max(time.perf_counter() - started - self._setup_seconds, 0.0))
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class _TimedHTTPAdapter(HTTPAdapter):
+    """使用可计时连接的 HTTPAdapter"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
+
+
+def _make_retry():
+    options = dict(
+        total=RETRY_TOTAL,
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=RETRY_STATUS,
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        raise_on_status=False,
+    )
+    try:
+        # 退避时间加随机抖动（urllib3 2.0 起支持）
+        return Retry(backoff_jitter=RETRY_JITTER, **options)
+    except TypeError:
+        return Retry(**options)
+
+
+def _make_adapter(pool_size, retry=True):
+    max_retries = _make_retry() if retry else 0
+    return _TimedHTTPAdapter(pool_connections=DEFAULT_POOL_SIZE, pool_maxsize=pool_size, max_retries=max_retries)
+
+
+def get_session():
+    """获取进程内共享的 Session，所有模块共用同一组长连接"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = PMCLSession()
+                adapter = _make_adapter(DEFAULT_POOL_SIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def get_download_session():
+    """获取文件下载使用的 Session：连接层不自动重试
+
+    文件下载由 transfer_policy.RetryPolicy 统一重试并计入熔断，连接层再重试会让
+    不可用的镜像在熔断或换镜像之前收到成倍的请求。
+    """
+    global _download_session
+    if _download_session is None:
+        with _session_lock:
+            if _download_session is None:
+                session = PMCLSession()
+                adapter = _make_adapter(DEFAULT_POOL_SIZE, retry=False)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _download_session = session
+    return _download_session
+
+
+def get_probe_session():
+    """获取用于探测镜像的 Session：不自动重试，卡住的镜像在一次超时后就判定为不可用"""
+    global _probe_session
+    if _probe_session is None:
+        with _session_lock:
+            if _probe_session is None:
+                session = PMCLSession()
+                adapter = _TimedHTTPAdapter(pool_connections=DEFAULT_POOL_SIZE, pool_maxsize=DEFAULT_POOL_SIZE, max_retries=0)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _probe_session = session
+    return _probe_session
+
+
+def set_host_pool_size(url_or_host, pool_size):
+    """为某个主机单独设置连接池大小（只会增大，不会缩小），共享 Session 和下载 Session 都生效"""
+    host = urlparse(url_or_host).netloc if "://" in url_or_host else url_or_host
+    if not host:
+        return
+    sessions = ((get_session(), True), (get_download_session(), False))
+    with _session_lock:
+        if _host_pool_sizes.get(host, 0) >= pool_size:
+            return
+        _host_pool_sizes[host] = pool_size
+        for session, retry in sessions:
+            adapter = _make_adapter(pool_size, retry)
+            session.mount(f"http://{host}/", adapter)
+            session.mount(f"https://{host}/", adapter)
@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import hashlib
+import zipfile
+from scan_index import scan_tree
+from object_store import sha1_file
+from verify_index import VerifiedIndex
+from library_rules import rules_allow, native_artifact
+from launch_builder import LaunchBuilder, library_path
+
+# 实例清单的格式版本，格式变化时旧的清单自动失效
+MANIFEST_FORMAT = 1
+# 其中任何文件变化都需要重新校验全部文件的目录（版本 JSON、资源索引决定了需要哪些文件）
+GLOBAL_SUBTREES = ("versions", "assets/indexes")
+
+
+class CheckResult:
+    """一次启动前检查的结果"""
+
+    def __init__(self):
+        self.problems = []  # 缺失或损坏的文件说明，为空表示可以启动
+        self.changed = []  # 与上次校验相比有变化的子目录
+        self.checked = 0  # 实际检查的文件数
+        self.fast = False  # 指纹未变化，直接跳过校验
+        self.seconds = 0.0
+
+    @property
+    def ok(self):
+        return not self.problems
+
+
+def _subtree(relative):
+    """文件所属的子目录：libraries 和 assets/objects 按第一级目录划分，其余按根目录划分"""
+    parts = relative.split("/")
+    if parts[0] == "libraries" and len(parts) > 2:
+        return "/".join(parts[:2])
+    if parts[:2] == ["assets", "objects"] and len(parts) > 3:
+        return "/".join(parts[:3])
+    if parts[0] == "assets" and len(parts) > 2:
+        return "/".join(parts[:2])
+    return parts[0]
+
+
+class InstanceVerifier:
+    """启动前的实例完整性检查
+
+    每个实例目录保存一份清单，记录上次校验通过时各子目录的指纹（文件数、总大小、
+    各文件大小和修改时间的摘要）。指纹一致时直接启动；不一致时只重新校验变化的
+    子目录，版本 JSON 或资源索引变化时校验全部文件。sha1 沿用下载器的已校验索引，
+    未变化的文件不会重新读取。
+    """
+
+    ROOTS = ("versions", "libraries", "assets/indexes", "assets/objects", "mods")
+
+    def __init__(self, game_dir, builder=None):
+        self.game_dir = os.path.abspath(game_dir)
+        self.manifest_path = os.path.join(self.game_dir, ".pmcl", "instance_manifest.json")
+        self.verified_index = VerifiedIndex(os.path.join(self.game_dir, ".pmcl", "verified_index.json"))
+        self.builder = builder or LaunchBuilder(game_dir)
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if manifest.get("format") != MANIFEST_FORMAT:
+            return {}
+        return manifest.get("versions", {})
+
+    def _save_manifest(self, versions):
+        os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"format": MANIFEST_FORMAT, "versions": versions}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def scan(self):
+        """扫描实例目录，返回 ({绝对路径: (大小, 修改时间ns)}, {子目录: 指纹})"""
+        files = {}
+        for root in self.ROOTS:
+            files.update(scan_tree(os.path.join(self.game_dir, *root.split("/"))))
+        groups = {}
+        prefix = len(self.game_dir) + 1
+        for path in sorted(files):
+            groups.setdefault(_subtree(path[prefix:].replace(os.sep, "/")), []).append(path)
+        fingerprints = {}
+        for name, paths in groups.items():
+            digest = hashlib.sha1()
+            total = 0
+            for path in paths:
+                size, mtime_ns = files[path]
+                total += size
+                digest.update(f"{path[prefix:]}\0{size}\0{mtime_ns}\n".encode('utf-8', 'surrogateescape'))
+            fingerprints[name] = [len(paths), total, digest.hexdigest()]
+        return files, fingerprints
+
+    def expected_files(self, version):
+        """启动需要的文件：{绝对路径: (sha1, 大小, 是否必需)}；资源文件缺失不影响启动"""
+        version_info, _ = self.builder.resolve_version(version)
+        libraries_dir = os.path.join(self.game_dir, "libraries")
+        expected = {}
+        for library in version_info["libraries"]:
+            if not rules_allow(library.get("rules")):
+                continue
+            artifact = library.get("downloads", {}).get("artifact")
+            relative = library_path(library)
+            if relative:
+                sha1, size = (artifact.get("sha1"), artifact.get("size")) if artifact else (None, None)
+                expected[os.path.join(libraries_dir, *relative.split("/"))] = (sha1, size, True)
+            natives = native_artifact(library)
+            if natives:
+                expected[os.path.join(libraries_dir, *natives["path"].split("/"))] = (natives.get("sha1"), natives.get("size"), True)
+
+        jar = version_info["jar"]
+        client = {}
+        try:
+            with open(os.path.join(self.game_dir, "versions", jar, f"{jar}.json"), 'r', encoding='utf-8') as f:
+                client = json.load(f).get("downloads", {}).get("client", {})
+        except (OSError, ValueError):
+            pass
+        expected[os.path.join(self.game_dir, "versions", jar, f"{jar}.jar")] = (client.get("sha1"), client.get("size"), True)
+
+        index_id = version_info.get("assetIndex", {}).get("id")
+        if index_id:
+            try:
+                with open(os.path.join(self.game_dir, "assets", "indexes", f"{index_id}.json"), 'r', encoding='utf-8') as f:
+                    objects = json.load(f).get("objects", {})
+            except (OSError, ValueError):
+                objects = {}
+            objects_dir = os.path.join(self.game_dir, "assets", "objects")
+            for info in objects.values():
+                sha1 = info["hash"]
+                expected[os.path.join(objects_dir, sha1[:2], sha1)] = (sha1, info.get("size"), False)
+        return expected
+
+    def _check_file(self, path, sha1, size, required, files, result):
+        stat = files.get(path)
+        if stat is None:
+            if required:
+                result.problems.append(f"缺少文件：{path}")
+            return
+        result.checked += 1
+        if size is not None and stat[0] != size:
+            result.problems.append(f"文件大小不正确：{path}")
+            return
+        if not sha1 or self.verified_index.lookup_stat(path, *stat) == sha1:
+            return
+        try:
+            actual = sha1_file(path)
+        except OSError as e:
+            result.problems.append(f"无法读取文件：{path} ({e})")
+            return
+        if actual != sha1:
+            self.verified_index.forget(path)
+            result.problems.append(f"文件已损坏：{path}")
+        else:
+            self.verified_index.record(path, sha1)
+
+    def check(self, version):
+        """检查启动 version 所需的文件，返回 CheckResult；全部正常时更新清单"""
+        started = time.perf_counter()
+        result = CheckResult()
+        files, fingerprints = self.scan()
+        manifest = self._load_manifest()
+        previous = manifest.get(version, {})
+        result.changed = sorted(name for name in set(fingerprints) | set(previous)
+                                if fingerprints.get(name) != previous.get(name))
+        if not result.changed:
+            result.fast = True
+            result.seconds = time.perf_counter() - started
+            return result
+
+        changed = set(result.changed)
+        verify_all = bool(changed & set(GLOBAL_SUBTREES))
+        prefix = len(self.game_dir) + 1
+        for path, (sha1, size, required) in self.expected_files(version).items():
+            if verify_all or _subtree(path[prefix:].replace(os.sep, "/")) in changed:
+                self._check_file(path, sha1, size, required, files, result)
+        # 模组没有可对照的哈希，只检查 jar 是否完整（能读取 zip 目录）
+        mods_dir = os.path.join(self.game_dir, "mods") + os.sep
+        if verify_all or "mods" in changed:
+            for path in files:
+                if path.startswith(mods_dir) and path.endswith(".jar"):
+                    result.checked += 1
+                    if not zipfile.is_zipfile(path):
+                        result.problems.append(f"模组文件已损坏：{path}")
+
+        self.verified_index.save()
+        if result.ok:
+            manifest[version] = fingerprints
+            self._save_manifest(manifest)
+        result.seconds = time.perf_counter() - started
+        return result
@@ -0,0 +1,339 @@
+import os
+import re
+import sys
+import json
+import ctypes
+import subprocess
+import threading
+from metadata_cache import DEFAULT_CACHE_DIR
+
+GB = 1024 * 1024 * 1024
+MB = 1024 * 1024
+
+AUTO = "auto"
+# 预设：低内存（8 GB 左右的笔记本）、高吞吐（默认）、低延迟（ZGC/Shenandoah，减少卡顿）
+PRESETS = ("low-memory", "throughput", "low-latency")
+PRESET_LABELS = {AUTO: "自动", "low-memory": "低内存", "throughput": "高吞吐", "low-latency": "低延迟"}
+# 总内存不超过该值时自动选择低内存预设
+LOW_MEMORY_TOTAL = 8 * GB
+# 给系统和其它程序保留的内存
+RESERVED_MEMORY = 2 * GB
+MIN_HEAP = 1 * GB
+# 各预设的堆大小：占总内存的比例、下限、上限
+HEAP_SIZING = {
+    "low-memory": (0.25, 1 * GB, 2 * GB),
+    "throughput": (0.5, 2 * GB, 12 * GB),
+    "low-latency": (0.4, 2 * GB, 10 * GB),
+}
+# 堆大小按该粒度向下取整
+HEAP_GRANULARITY = 256 * MB
+# 预先触碰整个堆时需要额外空闲的内存
+PRETOUCH_HEADROOM = 1 * GB
+# 探测 Java 时读取的 JVM 参数，用于判断 ZGC/Shenandoah/大页是否可用
+PROBED_FLAGS = ("UseZGC", "ZGenerational", "UseShenandoahGC", "UseLargePages", "UseTransparentHugePages", "UseStringDeduplication")
+PROBE_TIMEOUT = 15
+
+_probe_cache = None
+_probe_cache_lock = threading.Lock()
+
+
+def parse_memory(text):
+    """解析 "6G"、"4096M"、"4096m" 等内存大小，返回字节数（不带单位时按 MB）"""
+    match = re.fullmatch(r"\s*(\d+)\s*([gGmMkK]?)[bB]?\s*", str(text))
+    if not match:
+        raise ValueError(f"无法识别的内存大小：{text}（例如 6G 或 4096M）")
+    value = int(match.group(1))
+    unit = match.group(2).upper()
+    return value * {"G": GB, "K": 1024}.get(unit, MB)
+
+
+def format_memory(size):
+    """字节数转为 JVM 参数格式（能整除时用 G，否则用 M）"""
+    if size % GB == 0:
+        return f"{size // GB}G"
+    return f"{size // MB}M"
+
+
+class Hardware:
+    """本机的内存和 CPU 信息"""
+
+    def __init__(self, total_memory, free_memory, cpu_count, huge_pages=False, transparent_huge_pages=False):
+        self.total_memory = total_memory
+        self.free_memory = free_memory
+        self.cpu_count = cpu_count
+        self.huge_pages = huge_pages  # 系统预留了大页（Linux HugePages_Total > 0）
+        self.transparent_huge_pages = transparent_huge_pages  # 透明大页为 always 或 madvise
+
+
+def _windows_memory():
+    class MEMORYSTATUSEX(ctypes.Structure):
+        _fields_ = [
+            ("dwLength", ctypes.c_ulong),
+            ("dwMemoryLoad", ctypes.c_ulong),
+            ("ullTotalPhys", ctypes.c_ulonglong),
+            ("ullAvailPhys", ctypes.c_ulonglong),
+            ("ullTotalPageFile", ctypes.c_ulonglong),
+            ("ullAvailPageFile", ctypes.c_ulonglong),
+            ("ullTotalVirtual", ctypes.c_ulonglong),
+            ("ullAvailVirtual", ctypes.c_ulonglong),
+            ("ullAvailExtendedVirtual", ctypes.c_ulonglong),
+        ]
+
+    status = MEMORYSTATUSEX()
+    status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+    ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status))
+    return status.ullTotalPhys, status.ullAvailPhys
+
+
+def _linux_meminfo():
+    info = {}
+    with open("/proc/meminfo", "r") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            parts = value.split()
+            if parts:
+                info[name] = int(parts[0]) * (1024 if parts[-1] == "kB" else 1)
+    return info
+
+
+def detect_hardware():
+    """读取总内存、可用内存、可用 CPU 数和大页支持情况"""
+    try:
+        cpu_count = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        cpu_count = os.cpu_count() or 1
+    total = free = None
+    huge_pages = transparent = False
+    try:
+        if sys.platform == "win32":
+            total, free = _windows_memory()
+        elif os.path.exists("/proc/meminfo"):
+            info = _linux_meminfo()
+            total = info.get("MemTotal")
+            free = info.get("MemAvailable", info.get("MemFree"))
+            huge_pages = info.get("HugePages_Total", 0) > 0
+            try:
+                with open("/sys/kernel/mm/transparent_hugepage/enabled", "r") as f:
+                    transparent = "[never]" not in f.read()
+            except OSError:
+                pass
+        else:
+            total = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError) as e:
+        print(f"[WARN] 无法读取内存信息：{e}")
+    total = total or 8 * GB
+    # 取不到可用内存时（macOS）按总内存的一半估计
+    free = free if free is not None else total // 2
+    return Hardware(total, free, cpu_count, huge_pages, transparent)
+
+
+class JavaInfo:
+    """Java 的主版本号和支持的 JVM 参数"""
+
+    def __init__(self, major=None, flags=()):
+        self.major = major
+        self.flags = set(flags)
+
+    def supports(self, flag):
+        return flag in self.flags
+
+
+def parse_java_major(text):
+    """从 java -version 的输出中解析主版本号：1.8.0_372 -> 8，17.0.2 -> 17"""
+    match = re.search(r'version "(\d+)(?:\.(\d+))?', text)
+    if not match:
+        return None
+    major = int(match.group(1))
+    if major == 1 and match.group(2):
+        major = int(match.group(2))
+    return major
+
+
+class JavaProbeCache:
+    """缓存每个 Java 的探测结果，Java 文件变化（升级）后重新探测"""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(DEFAULT_CACHE_DIR, "java_probe.json")
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def probe(self, java_path):
+        try:
+            st = os.stat(java_path)
+            stamp = [st.st_size, st.st_mtime_ns]
+        except OSError:
+            stamp = None  # 可能是 PATH 中的命令名
+        with self._lock:
+            entry = self._entries.get(java_path)
+        if entry and stamp and entry["stamp"] == stamp:
+            return JavaInfo(entry["major"], entry["flags"])
+
+        info = self._run_probe(java_path)
+        if stamp and info.major is not None:
+            with self._lock:
+                self._entries[java_path] = {"stamp": stamp, "major": info.major, "flags": sorted(info.flags)}
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp_path = self.path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self._entries, f)
+                os.replace(tmp_path, self.path)
+        return info
+
+    @staticmethod
+    def _run_probe(java_path):
+        # 解锁实验参数后 PrintFlagsFinal 也会列出实验性的 ZGC/Shenandoah
+        command = [java_path, "-XX:+UnlockExperimentalVMOptions", "-XX:+PrintFlagsFinal", "-version"]
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, errors="replace", timeout=PROBE_TIMEOUT,
+                                    creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"[WARN] 无法探测 Java {java_path}：{e}")
+            return JavaInfo()
+        flags = set()
+        for line in result.stdout.splitlines():
+            match = re.match(r"\s*[\w:]+\s+(\w+)\s+:?=", line)
+            if match and match.group(1) in PROBED_FLAGS:
+                flags.add(match.group(1))
+        return JavaInfo(parse_java_major(result.stderr), flags)
+
+
+def get_java_probe_cache():
+    """获取进程内共享的 Java 探测缓存"""
+    global _probe_cache
+    if _probe_cache is None:
+        with _probe_cache_lock:
+            if _probe_cache is None:
+                _probe_cache = JavaProbeCache()
+    return _probe_cache
+
+
+class JvmTuning:
+    """调优结果：堆大小、GC 和完整的 JVM 参数"""
+
+    def __init__(self, preset, max_heap, min_heap, gc, args):
+        self.preset = preset
+        self.max_heap = max_heap
+        self.min_heap = min_heap
+        self.gc = gc
+        self.args = args
+
+    def describe(self):
+        return f"{PRESET_LABELS.get(self.preset, self.preset)}：堆 {format_memory(self.min_heap)}~{format_memory(self.max_heap)}，{self.gc}"
+
+
+def choose_preset(hardware):
+    """自动选择预设：内存较小的机器用低内存预设，其余用高吞吐预设"""
+    if hardware.total_memory <= LOW_MEMORY_TOTAL:
+        return "low-memory"
+    return "throughput"
+
+
+def _heap_size(preset, hardware):
+    ratio, lower, upper = HEAP_SIZING[preset]
+    size = max(lower, min(upper, int(hardware.total_memory * ratio)))
+    size = min(size, hardware.total_memory - RESERVED_MEMORY)
+    size = max(MIN_HEAP, size - size % HEAP_GRANULARITY)
+    return size
+
+
+def _gc_threads(cpu_count):
+    """并行 GC 线程数：JVM 默认公式，但给渲染线程和服务端线程留出两个核心"""
+    default = cpu_count if cpu_count <= 8 else 8 + (cpu_count - 8) * 5 // 8
+    return max(1, min(default, cpu_count - 2))
+
+
+def _choose_gc(preset, hardware, java):
+    if preset == "low-memory" and hardware.cpu_count <= 2:
+        return "serial"
+    if preset == "low-latency":
+        if java.major is not None and java.major >= 17 and java.supports("UseZGC"):
+            return "zgc"
+        if java.supports("UseShenandoahGC"):
+            return "shenandoah"
+    return "g1"
+
+
+def _gc_args(gc, preset, hardware, java):
+    if gc == "serial":
+        return ["-XX:+UseSerialGC"]
+    if gc == "zgc":
+        args = ["-XX:+UseZGC"]
+        # 21、22 需要手动开启分代 ZGC；23 起默认分代，该参数已废弃
+        if java.major in (21, 22) and java.supports("ZGenerational"):
+            args.append("-XX:+ZGenerational")
+        args.append(f"-XX:ConcGCThreads={max(1, hardware.cpu_count // 4)}")
+        return args
+    if gc == "shenandoah":
+        args = ["-XX:+UseShenandoahGC"]
+        if java.major is not None and java.major < 15:
+            args.insert(0, "-XX:+UnlockExperimentalVMOptions")
+        return args
+
+    threads = _gc_threads(hardware.cpu_count)
+    args = [
+        "-XX:+UnlockExperimentalVMOptions",
+        "-XX:+UseG1GC",
+        "-XX:G1NewSizePercent=20",
+        "-XX:G1ReservePercent=20",
+        f"-XX:MaxGCPauseMillis={25 if preset == 'low-latency' else 50}",
+        f"-XX:G1HeapRegionSize={4 if preset == 'low-memory' else 32}M",
+        "-XX:+ParallelRefProcEnabled",
+        f"-XX:ParallelGCThreads={threads}",
+        f"-XX:ConcGCThreads={max(1, threads // 4)}",
+    ]
+    if preset == "low-memory" and java.supports("UseStringDeduplication"):
+        args.append("-XX:+UseStringDeduplication")
+    return args
+
+
+def tune(preset=AUTO, hardware=None, java=None, overrides=None):
+    """根据硬件和 Java 版本生成 JVM 参数
+
+    overrides 中可以覆盖：max_memory、min_memory（如 "6G"）、gc（g1/zgc/shenandoah/serial）、
+    pretouch、large_pages（True/False）、extra_args（追加的参数列表）。
+    """
+    hardware = hardware or detect_hardware()
+    java = java or JavaInfo()
+    overrides = overrides or {}
+    if preset == AUTO:
+        preset = choose_preset(hardware)
+    if preset not in PRESETS:
+        raise ValueError(f"未知的 JVM 预设：{preset}")
+
+    max_heap = parse_memory(overrides["max_memory"]) if overrides.get("max_memory") else _heap_size(preset, hardware)
+    if max_heap > hardware.total_memory:
+        print(f"[WARN] 最大内存 {format_memory(max_heap)} 超过本机内存 {format_memory(hardware.total_memory - hardware.total_memory % MB)}")
+    if overrides.get("min_memory"):
+        min_heap = min(parse_memory(overrides["min_memory"]), max_heap)
+    elif preset == "low-memory":
+        min_heap = min(512 * MB, max_heap)  # 低内存时按需增长，不预先占用
+    else:
+        min_heap = max_heap  # 固定堆大小，避免运行中扩容造成的停顿
+
+    gc = overrides.get("gc") or _choose_gc(preset, hardware, java)
+    args = [f"-Xms{format_memory(min_heap)}", f"-Xmx{format_memory(max_heap)}"]
+    args += _gc_args(gc, preset, hardware, java)
+
+    # 预先触碰整个堆会让启动稍慢，但避免游戏中首次使用内存时的缺页停顿；空闲内存不足时不开启
+    pretouch = overrides.get("pretouch")
+    if pretouch is None:
+        pretouch = preset != "low-memory" and min_heap == max_heap and hardware.free_memory >= max_heap + PRETOUCH_HEADROOM
+    if pretouch:
+        args.append("-XX:+AlwaysPreTouch")
+
+    large_pages = overrides.get("large_pages")
+    if large_pages is None:
+        large_pages = preset != "low-memory"
+    if large_pages:
+        if hardware.huge_pages and java.supports("UseLargePages"):
+            args.append("-XX:+UseLargePages")
+        elif hardware.transparent_huge_pages and java.supports("UseTransparentHugePages"):
+            args.append("-XX:+UseTransparentHugePages")
+
+    extra = overrides.get("extra_args") or []
+    args += extra.split() if isinstance(extra, str) else list(extra)
+    return JvmTuning(preset, max_heap, min_heap, gc, args)
@@ -0,0 +1,317 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from metadata_cache import DEFAULT_CACHE_DIR
+from natives_cache import NativesCache, COMPLETE_MARKER
+from object_store import sha1_file
+from verify_index import VerifiedIndex
+from library_rules import rules_allow
+
+LAUNCHER_NAME = "PMCL"
+LAUNCHER_VERSION = "1.0"
+# 启动计划的格式版本，格式变化时旧的计划自动失效
+PLAN_FORMAT = 2
+# 旧版本（只有 minecraftArguments）没有 arguments.jvm，使用这些 JVM 参数
+LEGACY_JVM_ARGUMENTS = ["-Djava.library.path=${natives_directory}", "-cp", "${classpath}"]
+# 账号类型对应的 user_type
+USER_TYPES = {"offline": "legacy", "microsoft": "msa"}
+
+_VARIABLE = re.compile(r"\$\{(\w+)\}")
+
+
+class LaunchError(Exception):
+    """无法生成启动命令（版本文件缺失、库文件未下载等）"""
+
+
+def substitute(arg, variables):
+    """替换参数中的 ${name}；未知的变量保持原样"""
+    return _VARIABLE.sub(lambda m: str(variables.get(m.group(1), m.group(0))), arg)
+
+
+def expand_arguments(arguments, features=None):
+    """展开 arguments.jvm/game：字符串原样保留，带 rules 的条目按规则决定是否加入"""
+    result = []
+    for arg in arguments:
+        if isinstance(arg, str):
+            result.append(arg)
+        elif rules_allow(arg.get("rules"), features):
+            value = arg.get("value", [])
+            result.extend([value] if isinstance(value, str) else value)
+    return result
+
+
+def library_path(library):
+    """库文件相对 libraries 目录的路径；没有 downloads 时按 maven 坐标推算（Fabric 等加载器）"""
+    artifact = library.get("downloads", {}).get("artifact")
+    if artifact and artifact.get("path"):
+        return artifact["path"]
+    if "downloads" in library and not artifact:
+        return None  # 只有 natives 的旧版本库文件，不加入 classpath
+    name = library.get("name")
+    if not name:
+        return None
+    name, _, extension = name.partition("@")
+    parts = name.split(":")
+    if len(parts) < 3:
+        return None
+    group, artifact_id, version = parts[:3]
+    classifier = f"-{parts[3]}" if len(parts) > 3 else ""
+    return "/".join(group.split(".") + [artifact_id, version, f"{artifact_id}-{version}{classifier}.{extension or 'jar'}"])
+
+
+def _library_key(library):
+    """同一个库（不含版本号）只保留一个，子版本中的优先"""
+    parts = library.get("name", "").partition("@")[0].split(":")
+    if len(parts) < 3:
+        return library.get("name")
+    return ":".join(parts[:2] + parts[3:])
+
+
+class LaunchPlan:
+    """解析好的启动命令，账号信息之外的部分都已填好，可以直接缓存和复用"""
+
+    def __init__(self, version, java_path, main_class, jvm_args, game_args, classpath, natives_dir, sources, asset_index=None):
+        self.version = version
+        self.java_path = java_path
+        self.main_class = main_class
+        self.jvm_args = jvm_args
+        self.game_args = game_args
+        self.classpath = classpath
+        self.natives_dir = natives_dir
+        self.sources = sources  # 用到的版本 JSON 路径 -> sha1，任一变化时计划失效
+        self.asset_index = asset_index
+
+    def command(self, profile, extra_jvm_args=()):
+        """填入账号信息，返回完整的启动命令（账号相关的变量不写入缓存的计划）
+
+        extra_jvm_args 为每次启动时计算的参数（堆大小、GC 等），放在版本自带的 JVM 参数之前。
+        """
+        token = profile.get("access_token") or "0"
+        variables = {
+            "auth_player_name": profile["name"],
+            "auth_uuid": profile["uuid"],
+            "auth_access_token": token,
+            "auth_session": f"token:{token}:{profile['uuid']}",
+            "auth_xuid": profile.get("xuid", "0"),
+            "user_type": USER_TYPES.get(profile.get("type"), "mojang"),
+            "clientid": profile.get("client_id", ""),
+        }
+        jvm_args = [substitute(arg, variables) for arg in self.jvm_args]
+        game_args = [substitute(arg, variables) for arg in self.game_args]
+        return [self.java_path, *extra_jvm_args, *jvm_args, self.main_class, *game_args]
+
+    def to_dict(self):
+        return {
+            "format": PLAN_FORMAT,
+            "version": self.version,
+            "java_path": self.java_path,
+            "main_class": self.main_class,
+            "jvm_args": self.jvm_args,
+            "game_args": self.game_args,
+            "classpath": self.classpath,
+            "natives_dir": self.natives_dir,
+            "sources": self.sources,
+            "asset_index": self.asset_index,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("format") != PLAN_FORMAT:
+            return None
+        return cls(data["version"], data["java_path"], data["main_class"], data["jvm_args"],
+                   data["game_args"], data["classpath"], data["natives_dir"], data["sources"], data.get("asset_index"))
+
+
+class LaunchPlanCache:
+    """启动计划缓存：<root>/<key>.json
+
+    key 由版本 JSON 的哈希、Java 路径和启动选项组成（随硬件变化的 JVM 调优参数不在计划中）。版本 JSON 的哈希
+    按 (大小, 修改时间) 缓存在 source_index.json 中，重复启动时文件未变化就不再读取，也不必解析 JSON
+    或逐个检查几百个库文件。
+    """
+
+    def __init__(self, root=None):
+        self.root = root or os.path.join(DEFAULT_CACHE_DIR, 'launch_plans')
+        self._lock = threading.Lock()
+        self.source_index = VerifiedIndex(os.path.join(self.root, 'source_index.json'))
+
+    def source_sha1(self, path):
+        """版本 JSON 的 sha1；文件未变化时直接使用上次的结果"""
+        sha1 = self.source_index.lookup(path)
+        if sha1 is None:
+            sha1 = sha1_file(path)
+            self.source_index.record(path, sha1)
+            self.source_index.save()
+        return sha1
+
+    def _path(self, key):
+        return os.path.join(self.root, f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                plan = LaunchPlan.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+        if plan is None:
+            return None
+        # 继承的版本 JSON（如 Fabric 依赖的原版）变化后计划失效
+        try:
+            if any(self.source_sha1(path) != sha1 for path, sha1 in plan.sources.items()):
+                return None
+        except OSError:
+            return None
+        if plan.natives_dir and not os.path.exists(os.path.join(plan.natives_dir, COMPLETE_MARKER)):
+            return None
+        return plan
+
+    def put(self, key, plan):
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            path = self._path(key)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(plan.to_dict(), f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+
+
+class LaunchBuilder:
+    """根据版本 JSON 生成启动命令
+
+    处理 inheritsFrom 继承、库文件的 rules、mainClass，以及 arguments.jvm/game
+    （新版本）或 minecraftArguments（旧版本）中的参数模板。
+    """
+
+    def __init__(self, game_dir, cache=None, natives_cache=None):
+        self.game_dir = game_dir
+        self.versions_dir = os.path.join(game_dir, "versions")
+        self.libraries_dir = os.path.join(game_dir, "libraries")
+        self.assets_dir = os.path.join(game_dir, "assets")
+        self.cache = cache or LaunchPlanCache()
+        self.natives_cache = natives_cache or NativesCache()
+
+    def _json_path(self, version):
+        return os.path.join(self.versions_dir, version, f"{version}.json")
+
+    def plan_key(self, version, java_path, options):
+        """版本 JSON 的哈希 + Java 路径 + 启动选项"""
+        try:
+            version_hash = self.cache.source_sha1(self._json_path(version))
+        except OSError:
+            raise LaunchError(f"未找到版本 {version} 的版本文件，请先下载！")
+        key = json.dumps([os.path.abspath(self.game_dir), version, version_hash, java_path, options], sort_keys=True)
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def plan(self, version, java_path, options=None):
+        """获取启动计划，优先使用缓存；options 为固定加入计划的选项（jvm_args）"""
+        options = dict(options or {})
+        key = self.plan_key(version, java_path, options)
+        plan = self.cache.get(key)
+        if plan is None:
+            plan = self.build(version, java_path, options)
+            self.cache.put(key, plan)
+        return plan
+
+    def resolve_version(self, version):
+        """读取版本 JSON 并合并 inheritsFrom 链，返回 (合并后的版本信息, {父版本 JSON 路径: sha1})"""
+        chain = []
+        sources = {}
+        current = version
+        while current:
+            if current in (v["id"] for v in chain):
+                raise LaunchError(f"版本 {version} 的 inheritsFrom 存在循环")
+            path = self._json_path(current)
+            try:
+                with open(path, 'rb') as f:
+                    raw = f.read()
+            except OSError:
+                raise LaunchError(f"未找到版本 {current} 的版本文件，请先下载！")
+            info = json.loads(raw)
+            info.setdefault("id", current)
+            if current != version:
+                sources[path] = self.cache.source_sha1(path)
+            chain.append(info)
+            current = info.get("inheritsFrom")
+
+        merged = {"libraries": [], "arguments": {"jvm": [], "game": []}}
+        for info in chain:  # 子版本在前：库文件子版本优先，参数按父版本在前拼接
+            merged["libraries"].extend(info.get("libraries", []))
+            for key in ("mainClass", "minecraftArguments", "assetIndex", "assets", "type", "jar"):
+                if key in info and key not in merged:
+                    merged[key] = info[key]
+        for info in reversed(chain):
+            arguments = info.get("arguments", {})
+            merged["arguments"]["jvm"].extend(arguments.get("jvm", []))
+            merged["arguments"]["game"].extend(arguments.get("game", []))
+        merged["id"] = version
+        # 客户端 jar：自己目录下没有时使用被继承的版本的 jar
+        merged["jar"] = merged.get("jar") or next(
+            (info["id"] for info in chain
+             if os.path.exists(os.path.join(self.versions_dir, info["id"], f"{info['id']}.jar"))),
+            chain[-1]["id"])
+        return merged, sources
+
+    def build_classpath(self, version_info):
+        """按规则筛选库文件，返回 classpath（客户端 jar 在最后）；有文件缺失时报错"""
+        classpath = []
+        missing = []
+        seen = set()
+        for library in version_info["libraries"]:
+            if not rules_allow(library.get("rules")):
+                continue
+            relative = library_path(library)
+            key = _library_key(library)
+            if not relative or key in seen:
+                continue
+            seen.add(key)
+            path = os.path.join(self.libraries_dir, *relative.split("/"))
+            if not os.path.exists(path):
+                missing.append(path)
+            classpath.append(path)
+        jar = version_info["jar"]
+        client_jar = os.path.join(self.versions_dir, jar, f"{jar}.jar")
+        if not os.path.exists(client_jar):
+            missing.append(client_jar)
+        classpath.append(client_jar)
+        if missing:
+            raise LaunchError(f"缺少 {len(missing)} 个文件，请先下载版本：\n" + "\n".join(missing[:5]))
+        return classpath
+
+    def build(self, version, java_path, options):
+        """解析版本 JSON，生成启动计划（不读缓存）"""
+        version_info, sources = self.resolve_version(version)
+        if not version_info.get("mainClass"):
+            raise LaunchError(f"版本 {version} 缺少 mainClass")
+        classpath = self.build_classpath(version_info)
+        natives_dir = self.natives_cache.prepare_version(version_info, self.libraries_dir)
+
+        assets_index = version_info.get("assetIndex", {}).get("id") or version_info.get("assets", "legacy")
+        variables = {
+            "natives_directory": natives_dir,
+            "launcher_name": LAUNCHER_NAME,
+            "launcher_version": LAUNCHER_VERSION,
+            "classpath": os.pathsep.join(classpath),
+            "classpath_separator": os.pathsep,
+            "library_directory": self.libraries_dir,
+            "version_name": version,
+            "version_type": version_info.get("type", "release"),
+            "game_directory": self.game_dir,
+            "assets_root": self.assets_dir,
+            "game_assets": os.path.join(self.assets_dir, "virtual", "legacy"),
+            "assets_index_name": assets_index,
+            "user_properties": "{}",
+        }
+
+        arguments = version_info["arguments"]
+        if arguments["jvm"] or arguments["game"]:
+            jvm_template = expand_arguments(arguments["jvm"])
+            game_template = expand_arguments(arguments["game"])
+        else:
+            jvm_template = LEGACY_JVM_ARGUMENTS
+            game_template = version_info.get("minecraftArguments", "").split()
+        jvm_args = list(options.get("jvm_args", []))
+        jvm_args += [substitute(arg, variables) for arg in jvm_template]
+        game_args = [substitute(arg, variables) for arg in game_template]
+        return LaunchPlan(version, java_path, version_info["mainClass"], jvm_args, game_args, classpath, natives_dir, sources, assets_index)
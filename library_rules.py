@@ -0,0 +1,67 @@
+import re
+import sys
+import platform
+
+# 版本 JSON 中使用的系统名
+OS_NAMES = {"win32": "windows", "darwin": "osx"}
+
+
+def current_os():
+    """当前系统在版本 JSON 中的名称：windows / osx / linux"""
+    return OS_NAMES.get(sys.platform, "linux")
+
+
+def current_arch():
+    """当前 CPU 架构：x86 / x86_64 / arm64"""
+    machine = platform.machine().lower()
+    if machine in ("amd64", "x86_64"):
+        return "x86_64"
+    if machine in ("arm64", "aarch64"):
+        return "arm64"
+    if machine in ("i386", "i686", "x86"):
+        return "x86"
+    return machine
+
+
+def _rule_matches(rule, features):
+    os_rule = rule.get("os")
+    if os_rule:
+        if "name" in os_rule and os_rule["name"] != current_os():
+            return False
+        if "arch" in os_rule and os_rule["arch"] != current_arch():
+            return False
+        if "version" in os_rule and not re.search(os_rule["version"], platform.version()):
+            return False
+    for name, value in rule.get("features", {}).items():
+        if features.get(name, False) != value:
+            return False
+    return True
+
+
+def rules_allow(rules, features=None):
+    """按版本 JSON 的规则判断是否启用（没有规则时默认启用，最后一条匹配的规则生效）"""
+    if not rules:
+        return True
+    features = features or {}
+    allowed = False
+    for rule in rules:
+        if _rule_matches(rule, features):
+            allowed = rule.get("action") == "allow"
+    return allowed
+
+
+def native_classifier(library):
+    """旧版本库文件的 natives 分类名，如 natives-windows；没有时返回 None"""
+    classifier = library.get("natives", {}).get(current_os())
+    if not classifier:
+        return None
+    bits = "64" if current_arch() in ("x86_64", "arm64") else "32"
+    return classifier.replace("${arch}", bits)
+
+
+def native_artifact(library):
+    """库文件当前系统的 natives 下载信息（downloads.classifiers 中的一项）"""
+    classifier = native_classifier(library)
+    if not classifier:
+        return None
+    return library.get("downloads", {}).get("classifiers", {}).get(classifier)
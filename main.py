@@ -1,11 +1,10 @@
 import sys
 import os
-import requests
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                            QHBoxLayout, QPushButton, QComboBox, QLabel,
                            QLineEdit, QMessageBox, QFileDialog, QProgressBar,
                            QDialog, QTabWidget, QFormLayout, QGroupBox,
-                           QCheckBox, QSizePolicy)
+                           QCheckBox, QSizePolicy, QSpinBox)
 from PyQt5.QtCore import Qt, QThread, pyqtSignal
 from auth import MinecraftAuth
 import subprocess
@@ -15,6 +14,7 @@ from downloader_ui import DownloadManagerUI
 from mod_manager_ui import ModManagerUI
 from config_manager import ConfigManager
 from jdk_find import find_java_executables, recursive_java_search
+from jvm_tuning import AUTO, PRESET_LABELS
 
 # 仅在win32平台导入winreg
 if sys.platform == "win32":
@@ -34,8 +34,7 @@ def get_all_minecraft_versions():
     mirror = temp_downloader.get_fastest_mirror()
     print(f"[INFO] 选择的镜像: {mirror['name']} {mirror['manifest']}")
     try:
-        resp = requests.get(mirror['manifest'], timeout=10)
-        data = resp.json()
+        data = temp_downloader.get_version_manifest()
         return [v["id"] for v in data["versions"]]
     except Exception as e:
         print("获取版本列表失败：", e)
@@ -188,7 +187,7 @@ class PMCL(QMainWindow):
         memory_layout = QHBoxLayout()
         self.memory_label = QLabel("最大内存:")
         self.memory_combo = QComboBox()
-        self.memory_combo.addItems(["2G", "4G", "8G", "16G", "自定义"])
+        self.memory_combo.addItems(["自动", "2G", "4G", "8G", "16G", "自定义"])
         self.memory_combo.setCurrentIndex(0)
         self.memory_input = QLineEdit()
         self.memory_input.setPlaceholderText("如 6G 或 4096M")
@@ -196,6 +195,20 @@ class PMCL(QMainWindow):
         memory_layout.addWidget(self.memory_label)
         memory_layout.addWidget(self.memory_combo)
         memory_layout.addWidget(self.memory_input)
+        # JVM 预设：根据本机内存、CPU 和 Java 版本选择 GC 和堆大小
+        self.jvm_preset_label = QLabel("JVM 预设:")
+        self.jvm_preset_combo = QComboBox()
+        for preset, label in PRESET_LABELS.items():
+            self.jvm_preset_combo.addItem(label, preset)
+        memory_layout.addWidget(self.jvm_preset_label)
+        memory_layout.addWidget(self.jvm_preset_combo)
+        # 为 版本 + Java + 模组组合 生成类数据共享存档，加快之后的启动（需要 Java 13+）
+        self.cds_checkbox = QCheckBox("CDS 加速启动")
+        memory_layout.addWidget(self.cds_checkbox)
+        # 启动时预读库文件和资源文件，机械硬盘或网络共享上的游戏目录启动更快
+        self.warmup_checkbox = QCheckBox("预读游戏文件")
+        self.warmup_checkbox.setChecked(True)
+        memory_layout.addWidget(self.warmup_checkbox)
         memory_layout.addStretch()
         self.memory_combo.currentTextChanged.connect(self.on_memory_combo_changed)
         memory_group = QGroupBox("内存管理")
@@ -268,15 +281,29 @@ class PMCL(QMainWindow):
         # Connect signal for mirror combo
         self.mirror_combo.currentTextChanged.connect(self.on_mirror_combo_changed)
 
+        # 下载限速
+        speed_limit_layout = QHBoxLayout()
+        self.speed_limit_label = QLabel("下载限速 (KB/s，0 为不限速):")
+        self.speed_limit_input = QSpinBox()
+        self.speed_limit_input.setRange(0, 1024 * 1024)
+        self.speed_limit_input.setSingleStep(256)
+        speed_limit_layout.addWidget(self.speed_limit_label)
+        speed_limit_layout.addWidget(self.speed_limit_input)
+        speed_limit_layout.addStretch()
+
         # Download buttons
         add_version_button = QPushButton("添加版本下载")
         add_assets_button = QPushButton("添加资源下载")
+        add_version_button.clicked.connect(lambda: self.add_to_queue('version'))
+        add_assets_button.clicked.connect(lambda: self.add_to_queue('assets'))
 
         # Add download/pause buttons and progress bar back
         self.download_button = QPushButton("开始下载队列")
         self.download_button.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Preferred)
         self.pause_button = QPushButton("暂停下载")
         self.pause_button.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Preferred)
+        self.cancel_button = QPushButton("取消下载")
+        self.cancel_button.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Preferred)
         self.progress_bar = QProgressBar()
         self.progress_bar.setVisible(True)
 
@@ -284,12 +311,14 @@ class PMCL(QMainWindow):
         self.status_label = QLabel("等待任务...")
         download_layout.addLayout(download_version_layout)
         download_layout.addLayout(mirror_layout) # Add mirror selection layout
+        download_layout.addLayout(speed_limit_layout)
         download_layout.addWidget(add_version_button)
         download_layout.addWidget(add_assets_button)
         download_layout.addWidget(self.status_label)
         # Add download/pause buttons and progress bar to the layout
         download_layout.addWidget(self.download_button)
         download_layout.addWidget(self.pause_button)
+        download_layout.addWidget(self.cancel_button)
         download_layout.addWidget(self.progress_bar)
 
         # Add mod management UI elements before initializing ModManagerUI
@@ -372,7 +401,7 @@ class PMCL(QMainWindow):
         # 初始化管理器
         self.auth_instance = MinecraftAuth()
         self.auth_manager = AuthManagerUI(self.auth_instance, self.login_label, self.login_button, self)
-        self.download_manager = DownloadManagerUI(self.status_label, self.progress_bar, self.download_button, self.pause_button, self.dir_input, self.download_version_combo, self.download_queue, self, self.download_mirror_label, self.config_manager)
+        self.download_manager = DownloadManagerUI(self.status_label, self.progress_bar, self.download_button, self.pause_button, self.dir_input, self.download_version_combo, self.download_queue, self, self.download_mirror_label, self.config_manager, self.speed_limit_input, self.cancel_button)
         self.mod_manager = ModManagerUI(self.mod_list, self.search_mod_input, self.add_mod_button, self.delete_mod_button, self.search_mod_button, self)
 
         # 连接信号
@@ -537,24 +566,36 @@ class PMCL(QMainWindow):
                  self.memory_combo.setCurrentText('自定义')
                  self.memory_input.setText(saved_memory)
                  self.memory_input.setVisible(True)
+        index = self.jvm_preset_combo.findData(config.get('jvm_preset', AUTO))
+        if index != -1:
+            self.jvm_preset_combo.setCurrentIndex(index)
+        self.cds_checkbox.setChecked(bool(config.get('enable_cds', False)))
+        self.warmup_checkbox.setChecked(bool(config.get('enable_warmup', True)))
 
     def launch_game(self):
         # 启动游戏逻辑将委托给GameLauncher
         selected_version = self.launch_version_combo.currentText()
         # Get the version-specific game directory
         game_dir = self.get_version_game_dir(selected_version)
-        java_path = self.java_combo.currentText()
+        # 下拉框中显示的是名称，实际路径在 java_paths_map 中
+        java_path = self.java_paths_map.get(self.java_combo.currentText(), self.java_combo.currentText())
         # Get memory setting
         memory_setting = self.memory_combo.currentText()
         if memory_setting == '自定义':
-            max_memory = self.memory_input.text()
+            max_memory = self.memory_input.text().strip()
+            if not max_memory:
+                QMessageBox.warning(self, "错误", "请输入自定义内存大小，如 6G 或 4096M")
+                return
+        elif memory_setting == '自动':
+            max_memory = None # 由 JVM 预设根据本机内存决定
         else:
             max_memory = memory_setting
+        jvm_preset = self.jvm_preset_combo.currentData() or AUTO
 
         if not selected_version:
             QMessageBox.warning(self, "错误", "未选择有效的游戏版本！")
             return
-        if java_path == "未找到Java，请检查安装或环境变量":
+        if not java_path or java_path == "未找到Java，请检查安装或环境变量":
             QMessageBox.warning(self, "错误", "未选择有效的Java可执行文件！")
             return
 
@@ -563,6 +604,9 @@ class PMCL(QMainWindow):
         # Save memory setting to config
         config = self.config_manager.load_config()
         config['max_memory'] = memory_setting
+        config['jvm_preset'] = jvm_preset
+        config['enable_cds'] = self.cds_checkbox.isChecked()
+        config['enable_warmup'] = self.warmup_checkbox.isChecked()
         if memory_setting == '自定义':
             config['custom_memory'] = max_memory # Save custom value if applicable
         else:
@@ -572,7 +616,7 @@ class PMCL(QMainWindow):
 
         # Now, launch the game using GameLauncher
         self.game_launcher = GameLauncher(game_dir)
-        self.game_launcher.launch_game(selected_version, java_path, self.current_profile, max_memory) # Pass max_memory
+        self.game_launcher.launch_game(selected_version, java_path, self.current_profile, max_memory, jvm_preset, self.cds_checkbox.isChecked(), self.warmup_checkbox.isChecked())
 
     def browse_and_search_java(self):
         """让用户选择目录并递归搜索Java可执行文件"""
@@ -0,0 +1,114 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from http_session import get_session
+
+# 默认缓存目录（项目根目录下的 cache 文件夹）
+DEFAULT_CACHE_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'cache')
+# 版本清单的有效期（秒），过期后用 ETag/If-Modified-Since 重新验证
+MANIFEST_TTL = 10 * 60
+
+
+class MetadataCache:
+    """版本清单、版本 JSON 和资源索引的磁盘缓存
+
+    每个缓存项保存为 <key> 和 <key>.meta 两个文件，meta 中记录 ETag、
+    Last-Modified 和上次验证时间。ttl 为 None 表示永不过期（版本 JSON 和资源索引
+    的 URL 中带有 sha1，内容不会变化）。网络不可用时直接返回已有缓存。
+    """
+
+    def __init__(self, cache_dir=None, manifest_ttl=MANIFEST_TTL):
+        self.cache_dir = cache_dir or os.path.join(DEFAULT_CACHE_DIR, 'metadata')
+        self.manifest_ttl = manifest_ttl
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _paths(self, key):
+        path = os.path.join(self.cache_dir, *key.split('/'))
+        return path, path + '.meta'
+
+    def _read(self, key):
+        path, meta_path = self._paths(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None, {}
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {}
+        return data, meta
+
+    def _write_atomic(self, path, text):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def _write_meta(self, key, meta):
+        _, meta_path = self._paths(key)
+        self._write_atomic(meta_path, json.dumps(meta))
+
+    def get_json(self, url, key, ttl=None):
+        """获取 url 对应的 JSON，优先使用缓存，必要时发送条件请求"""
+        data, meta = self._read(key)
+        if data is not None:
+            fetched_at = meta.get('fetched_at', 0)
+            if ttl is None or time.time() - fetched_at < ttl:
+                return data
+
+        headers = {}
+        if data is not None:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        try:
+            response = get_session().get(url, headers=headers)
+            if response.status_code == 304 and data is not None:
+                meta['fetched_at'] = time.time()
+                with self._lock:
+                    self._write_meta(key, meta)
+                return data
+            response.raise_for_status()
+            text = response.text
+            new_data = json.loads(text)
+        except Exception as e:
+            if data is not None:
+                print(f"[WARN] 获取 {url} 失败，使用本地缓存：{e}")
+                return data
+            raise
+
+        new_meta = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched_at': time.time(),
+        }
+        path, _ = self._paths(key)
+        with self._lock:
+            self._write_atomic(path, text)
+            self._write_meta(key, new_meta)
+        return new_data
+
+    def get_manifest(self, url):
+        """获取版本清单（有 TTL）
+
+        不同镜像的清单中的地址不同（局域网镜像会改写为指向自己），按 URL 分别缓存。
+        """
+        key = f"manifests/{hashlib.sha1(url.encode('utf-8')).hexdigest()}.json"
+        return self.get_json(url, key, ttl=self.manifest_ttl)
+
+    def get_version_json(self, version, url):
+        """获取某个版本的 JSON（永久缓存）"""
+        return self.get_json(url, f'versions/{version}.json')
+
+    def get_asset_index(self, index_id, url):
+        """获取资源索引（永久缓存）"""
+        return self.get_json(url, f'indexes/{index_id}.json')
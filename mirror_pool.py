@@ -0,0 +1,73 @@
+import threading
+from urllib.parse import urljoin
+
+# 官方地址前缀 -> 镜像上的对应路径（BMCLAPI 格式）
+OFFICIAL_PREFIXES = {
+    "https://launchermeta.mojang.com/": "",
+    "https://launcher.mojang.com/": "",
+    "https://piston-meta.mojang.com/": "",
+    "https://piston-data.mojang.com/": "",
+    "https://libraries.minecraft.net/": "maven/",
+    "https://resources.download.minecraft.net/": "assets/",
+}
+
+
+def resolve_url(mirror, url):
+    """把官方下载地址转换为某个镜像上的地址"""
+    if mirror.get("official"):
+        return url
+    for prefix, path in OFFICIAL_PREFIXES.items():
+        if url.startswith(prefix):
+            return urljoin(mirror["base"], path + url[len(prefix):])
+    return url
+
+
+class MirrorPool:
+    """镜像池：按优先级排列所有镜像，下载失败的镜像会被排到后面
+
+    第一个镜像是用户设置（或已选好）的镜像，始终排在最前；传入 scores（MirrorScores）时，
+    其余的备用镜像按评分排序。失败次数多的镜像排到后面。
+    """
+
+    def __init__(self, mirrors, scores=None):
+        self.mirrors = []
+        seen = set()
+        for mirror in mirrors:
+            if mirror["base"] not in seen:
+                seen.add(mirror["base"])
+                self.mirrors.append(mirror)
+        self.scores = scores
+        self._failures = {}
+        self._lock = threading.Lock()
+
+    def ordered(self):
+        """按失败次数排序后的镜像列表（失败次数相同时首选镜像在前，备用镜像按评分或原有优先级）"""
+        with self._lock:
+            failures = dict(self._failures)
+        # 自定义镜像（如局域网镜像）没有评分数据，不能让评分把它排到后面
+        preferred, fallbacks = self.mirrors[:1], self.mirrors[1:]
+        if self.scores:
+            fallbacks = self.scores.rank(fallbacks)
+        return sorted(preferred + fallbacks, key=lambda m: failures.get(m["name"], 0))
+
+    def candidates(self, url):
+        """返回 [(镜像, 镜像上的地址)]，地址相同的镜像只保留一个"""
+        result = []
+        seen = set()
+        for mirror in self.ordered():
+            mirror_url = resolve_url(mirror, url)
+            if mirror_url not in seen:
+                seen.add(mirror_url)
+                result.append((mirror, mirror_url))
+        return result
+
+    def report_failure(self, mirror):
+        with self._lock:
+            self._failures[mirror["name"]] = self._failures.get(mirror["name"], 0) + 1
+        if self.scores:
+            self.scores.record_failure(mirror)
+
+    def report_success(self, mirror):
+        with self._lock:
+            if self._failures.get(mirror["name"]):
+                self._failures[mirror["name"]] -= 1
@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from http_session import get_probe_session
+from metadata_cache import DEFAULT_CACHE_DIR
+
+# 探测参数：延迟用 HEAD 请求，吞吐量用一次 256KB 的 Range 请求
+PROBE_TIMEOUT = 3
+PROBE_RANGE_BYTES = 256 * 1024
+# 真实下载中，小于该大小的文件只用来更新延迟，大文件用来更新吞吐量
+THROUGHPUT_SAMPLE_MIN = 256 * 1024
+# 指数加权平均系数，以及历史分数的半衰期（秒）
+EWMA_ALPHA = 0.3
+SCORE_HALF_LIFE = 24 * 3600
+# 打分时假设的典型文件大小（字节）
+TYPICAL_FILE_SIZE = 512 * 1024
+# 没有任何数据时的默认值（偏保守，未测过的镜像排在已测过且正常的镜像之后）
+DEFAULT_LATENCY = PROBE_TIMEOUT
+DEFAULT_THROUGHPUT = 256 * 1024
+
+_scores = None
+_scores_lock = threading.Lock()
+
+
+class MirrorScores:
+    """镜像评分：记录每个镜像的延迟和吞吐量，持久化到磁盘
+
+    分数越低越好，表示下载一个典型文件预计需要的秒数。历史数据会随时间衰减，
+    越久没有更新的镜像越接近默认分数。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(DEFAULT_CACHE_DIR, 'mirror_scores.json')
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._dirty = False
+        self._probing = False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._stats = json.load(f)
+        except (OSError, ValueError):
+            self._stats = {}
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._stats, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+
+    def has_scores(self, mirrors):
+        return any(m["name"] in self._stats for m in mirrors)
+
+    def _update(self, name, latency=None, throughput=None):
+        with self._lock:
+            stats = self._stats.setdefault(name, {"latency": DEFAULT_LATENCY, "throughput": DEFAULT_THROUGHPUT, "updated": 0})
+            weight = self._weight(stats)
+            # 旧数据越旧，新样本的权重越大
+            alpha = max(EWMA_ALPHA, 1 - weight)
+            if latency is not None:
+                stats["latency"] = alpha * latency + (1 - alpha) * stats["latency"]
+            if throughput is not None:
+                stats["throughput"] = alpha * throughput + (1 - alpha) * stats["throughput"]
+            stats["updated"] = time.time()
+            self._dirty = True
+
+    def _weight(self, stats):
+        age = time.time() - stats.get("updated", 0)
+        return 0.5 ** (age / SCORE_HALF_LIFE)
+
+    def score(self, mirror):
+        """预计下载一个典型文件的秒数（已按数据新旧程度衰减）"""
+        stats = self._stats.get(mirror["name"])
+        if not stats:
+            return DEFAULT_LATENCY + TYPICAL_FILE_SIZE / DEFAULT_THROUGHPUT
+        weight = self._weight(stats)
+        latency = weight * stats["latency"] + (1 - weight) * DEFAULT_LATENCY
+        throughput = weight * stats["throughput"] + (1 - weight) * DEFAULT_THROUGHPUT
+        return latency + TYPICAL_FILE_SIZE / max(throughput, 1)
+
+    def rank(self, mirrors):
+        """按分数从好到差排序（稳定排序，分数相同保持原顺序）"""
+        return sorted(mirrors, key=self.score)
+
+    def record_failure(self, mirror):
+        self._update(mirror["name"], latency=PROBE_TIMEOUT * 2, throughput=0)
+
+    def record_transfer(self, mirror, size, elapsed):
+        """用真实下载的数据更新分数"""
+        if elapsed <= 0:
+            return
+        if size >= THROUGHPUT_SAMPLE_MIN:
+            self._update(mirror["name"], throughput=size / elapsed)
+        else:
+            self._update(mirror["name"], latency=elapsed)
+
+    def probe(self, mirror):
+        """探测单个镜像的延迟和吞吐量，失败返回 False"""
+        session = get_probe_session()
+        try:
+            start = time.time()
+            response = session.head(mirror["manifest"], timeout=PROBE_TIMEOUT, allow_redirects=True)
+            latency = time.time() - start
+            if response.status_code >= 400:
+                raise Exception(f"HTTP {response.status_code}")
+
+            start = time.time()
+            response = session.get(mirror["manifest"], timeout=PROBE_TIMEOUT,
+                                   headers={"Range": f"bytes=0-{PROBE_RANGE_BYTES - 1}"})
+            elapsed = time.time() - start
+            response.raise_for_status()
+            # 扣除一次往返延迟，只计算传输部分
+            transfer_time = max(elapsed - latency, 1e-3)
+            self._update(mirror["name"], latency=latency, throughput=len(response.content) / transfer_time)
+            return True
+        except Exception as e:
+            print(f"[WARN] 镜像 {mirror['name']} 探测失败：{e}")
+            self.record_failure(mirror)
+            return False
+
+    def probe_all(self, mirrors):
+        """并发探测所有镜像，总耗时约等于最慢的单个探测"""
+        with ThreadPoolExecutor(max_workers=max(1, len(mirrors))) as executor:
+            list(executor.map(self.probe, mirrors))
+        self.save()
+        return self.rank(mirrors)
+
+    def probe_first(self, mirrors):
+        """并发探测所有镜像，返回第一个探测成功的镜像，不等待其余镜像
+
+        其余探测在后台完成后保存分数。全部失败时返回评分最好的镜像。
+        """
+        executor = ThreadPoolExecutor(max_workers=max(1, len(mirrors)), thread_name_prefix="mirror-probe")
+        futures = {executor.submit(self.probe, mirror): mirror for mirror in mirrors}
+        executor.shutdown(wait=False)
+
+        def finish():
+            wait(futures)
+            self.save()
+
+        threading.Thread(target=finish, name="mirror-probe-save", daemon=True).start()
+        for future in as_completed(futures):
+            if future.result():
+                return futures[future]
+        return self.rank(mirrors)[0]
+
+    def refresh_in_background(self, mirrors):
+        """在后台线程中重新探测并保存分数，不阻塞调用方"""
+        with self._lock:
+            if self._probing:
+                return
+            self._probing = True
+
+        def run():
+            try:
+                self.probe_all(mirrors)
+            finally:
+                self._probing = False
+
+        threading.Thread(target=run, name="mirror-probe", daemon=True).start()
+
+
+def get_mirror_scores():
+    """获取进程内共享的镜像评分"""
+    global _scores
+    if _scores is None:
+        with _scores_lock:
+            if _scores is None:
+                _scores = MirrorScores()
+    return _scores
@@ -0,0 +1,278 @@
+import os
+import re
+import json
+import hashlib
+import threading
+import posixpath
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urljoin, urlsplit, unquote
+import requests
+import urllib3.exceptions
+from http_session import get_session, set_host_pool_size
+from metadata_cache import MetadataCache, DEFAULT_CACHE_DIR, MANIFEST_TTL
+from object_store import ObjectStore
+from mirror_pool import OFFICIAL_PREFIXES
+
+# 默认上游（BMCLAPI）和监听端口
+DEFAULT_UPSTREAM = "https://bmclapi2.bangbang93.com/"
+DEFAULT_PORT = 8765
+# 同时向上游发起的最大连接数
+UPSTREAM_POOL_SIZE = 32
+# 等待连接的队列长度，局域网内多台机器同时启动时避免连接被拒绝
+REQUEST_QUEUE_SIZE = 128
+# 路径中的 sha1（资源文件 assets/xx/<sha1>、客户端 v1/objects/<sha1>/client.jar 等）
+SHA1_SEGMENT = re.compile(r"(?:^|/)([0-9a-f]{40})(?:/|$)")
+# 有 TTL 的元数据（版本清单），其余 JSON 的地址中带有 sha1，内容不会变化
+MANIFEST_PREFIX = "mc/game/"
+BYTE_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class UpstreamError(Exception):
+    """上游返回错误或不可用，status 为要返回给客户端的状态码"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class MirrorCache:
+    """局域网镜像的本地缓存：未命中时从上游获取
+
+    - JSON 元数据（版本清单、版本 JSON、资源索引）存在 MetadataCache 中，版本清单按 TTL 重新验证
+    - 路径中带 sha1 的文件存入共享仓库 ObjectStore，下载后校验
+    - 其它文件（maven/ 下的库文件）按路径存放，内容视为不变
+
+    同一路径同时只会向上游请求一次，其它请求等待其完成后直接使用缓存。
+    """
+
+    def __init__(self, upstream=DEFAULT_UPSTREAM, cache_dir=None, store=None, manifest_ttl=MANIFEST_TTL):
+        self.upstream = upstream if upstream.endswith('/') else upstream + '/'
+        self.cache_dir = cache_dir or os.path.join(DEFAULT_CACHE_DIR, 'mirror')
+        self.files_dir = os.path.join(self.cache_dir, 'files')
+        self.metadata = MetadataCache(os.path.join(self.cache_dir, 'metadata'), manifest_ttl)
+        self.store = store or ObjectStore()
+        self._fill_locks = {}
+        self._fill_locks_lock = threading.Lock()
+        set_host_pool_size(self.upstream, UPSTREAM_POOL_SIZE)
+
+    def _fill_lock(self, path):
+        with self._fill_locks_lock:
+            lock = self._fill_locks.get(path)
+            if lock is None:
+                lock = self._fill_locks[path] = threading.Lock()
+            return lock
+
+    def get_json(self, path, base):
+        """返回 JSON 元数据的内容（bytes），其中的地址已改写为指向本镜像"""
+        ttl = self.metadata.manifest_ttl if path.startswith(MANIFEST_PREFIX) else None
+        with self._fill_lock(path):
+            try:
+                data = self.metadata.get_json(urljoin(self.upstream, path), path, ttl)
+            except requests.HTTPError as e:
+                raise UpstreamError(e.response.status_code if e.response is not None else 502, str(e))
+            except (requests.RequestException, ValueError) as e:
+                raise UpstreamError(502, str(e))
+        text = json.dumps(data, ensure_ascii=False)
+        # 上游改写过的地址换成本镜像；版本清单中的官方地址也换成本镜像，
+        # 这样客户端获取版本 JSON 时也会经过本镜像（其它文件的官方地址由客户端自行换算）
+        text = text.replace(self.upstream, base)
+        if path.startswith(MANIFEST_PREFIX):
+            for prefix, mirror_path in OFFICIAL_PREFIXES.items():
+                text = text.replace(prefix, base + mirror_path)
+        return text.encode('utf-8')
+
+    def get_file(self, path):
+        """返回 (本地文件路径, sha1)，sha1 未知时为 None"""
+        match = SHA1_SEGMENT.search(path)
+        sha1 = match.group(1) if match else None
+        local_path = self.store.path_for(sha1) if sha1 else os.path.join(self.files_dir, *path.split('/'))
+        if os.path.exists(local_path):
+            return local_path, sha1
+        with self._fill_lock(path):
+            if not os.path.exists(local_path):
+                self._fill(path, local_path, sha1)
+        return local_path, sha1
+
+    def _fill(self, path, local_path, sha1):
+        url = urljoin(self.upstream, path)
+        tmp_path = f"{local_path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            with get_session().get(url, stream=True) as response:
+                if response.status_code != 200:
+                    raise UpstreamError(404 if response.status_code == 404 else 502,
+                                        f"上游返回 {response.status_code}：{url}")
+                response.raw.decode_content = True
+                sha1_hash = hashlib.sha1()
+                with open(tmp_path, 'wb') as f:
+                    while True:
+                        chunk = response.raw.read(1024 * 1024)
+                        if not chunk:
+                            break
+                        sha1_hash.update(chunk)
+                        f.write(chunk)
+            if sha1 and sha1_hash.hexdigest() != sha1:
+                raise UpstreamError(502, f"上游文件校验失败：{url}")
+            os.replace(tmp_path, local_path)
+        except (requests.RequestException, urllib3.exceptions.HTTPError) as e:
+            raise UpstreamError(502, f"无法连接上游：{e}")
+        except OSError as e:
+            # 磁盘已满、没有写权限等本地错误，返回 500 而不是直接断开连接
+            raise UpstreamError(500, f"无法写入缓存 {local_path}：{e}")
+        finally:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+class MirrorRequestHandler(BaseHTTPRequestHandler):
+    """按 BMCLAPI 的路径格式提供文件，支持条件请求和单个 Range"""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "PMCLMirror"
+    # 响应头和文件内容分两次发送，关闭 Nagle 避免每个请求额外等待
+    disable_nagle_algorithm = True
+
+    def do_HEAD(self):
+        self._handle(send_body=False)
+
+    def do_GET(self):
+        self._handle(send_body=True)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _request_path(self):
+        """规范化请求路径，拒绝跳出根目录的路径"""
+        path = unquote(urlsplit(self.path).path)
+        path = posixpath.normpath(path).lstrip('/')
+        if not path or path == '.' or path.startswith('..') or '\\' in path:
+            return None
+        return path
+
+    def _handle(self, send_body):
+        path = self._request_path()
+        if path is None:
+            self.send_error(404)
+            return
+        cache = self.server.cache
+        try:
+            if path.endswith('.json'):
+                host = self.headers.get('Host') or f"{self.server.server_address[0]}:{self.server.server_address[1]}"
+                body = cache.get_json(path, f"http://{host}/")
+                etag = '"%s"' % hashlib.sha1(body).hexdigest()
+                self._send(body, len(body), etag, None, "application/json", send_body)
+            else:
+                local_path, sha1 = cache.get_file(path)
+                with open(local_path, 'rb') as f:
+                    st = os.fstat(f.fileno())
+                    etag = f'"{sha1}"' if sha1 else f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+                    self._send(f, st.st_size, etag, st.st_mtime, "application/octet-stream", send_body)
+        except UpstreamError as e:
+            self.send_error(e.status, explain=str(e))
+        except (ConnectionError, TimeoutError):
+            # 客户端提前断开
+            self.close_connection = True
+
+    def _not_modified(self, etag, mtime):
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is not None:
+            return if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since and mtime is not None:
+            try:
+                return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _byte_range(self, size, etag):
+        """解析 Range 头，返回 (start, end)、None（返回完整内容）或 False（范围无效）"""
+        header = self.headers.get('Range')
+        if not header:
+            return None
+        if_range = self.headers.get('If-Range')
+        if if_range and if_range.strip() != etag:
+            return None
+        match = BYTE_RANGE.match(header.strip())
+        if not match:
+            # 多个范围等不支持的格式，按规范返回完整内容
+            return None
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        elif last:
+            start = max(size - int(last), 0)
+            end = size - 1
+        else:
+            return False
+        if start >= size or start > end:
+            return False
+        return start, end
+
+    def _send(self, content, size, etag, mtime, content_type, send_body):
+        """content 为 bytes 或已打开的文件"""
+        if self._not_modified(etag, mtime):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        byte_range = self._byte_range(size, etag)
+        if byte_range is False:
+            self.send_response(416)
+            self.send_header('Content-Range', f"bytes */{size}")
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        start, end = byte_range or (0, size - 1)
+        length = end - start + 1 if size else 0
+
+        self.send_response(206 if byte_range else 200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(length))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', etag)
+        if mtime is not None:
+            self.send_header('Last-Modified', formatdate(mtime, usegmt=True))
+        if byte_range:
+            self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        if not send_body or not length:
+            return
+        if isinstance(content, bytes):
+            self.wfile.write(content[start:end + 1])
+        else:
+            self.wfile.flush()
+            # 由内核直接把文件发送到套接字
+            self.connection.sendfile(content, start, length)
+
+
+class MirrorServer(ThreadingHTTPServer):
+    """局域网缓存镜像服务器
+
+    其它 PMCL 把自定义镜像源设置为 http://<本机地址>:<端口>/ 即可使用。
+    """
+
+    request_queue_size = REQUEST_QUEUE_SIZE
+
+    def __init__(self, address, cache, verbose=False):
+        self.cache = cache
+        self.verbose = verbose
+        super().__init__(address, MirrorRequestHandler)
+
+
+def serve(host="0.0.0.0", port=DEFAULT_PORT, upstream=DEFAULT_UPSTREAM, cache_dir=None, store=None, verbose=False):
+    """启动镜像服务器，直到按 Ctrl+C"""
+    server = MirrorServer((host, port), MirrorCache(upstream, cache_dir, store), verbose)
+    print(f"镜像服务器已启动：http://{host}:{port}/（上游 {upstream}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -1,6 +1,7 @@
 import os
 import shutil
-import requests
+from http_session import get_session
+from bandwidth import get_bandwidth_limiter, PRIORITY_MODS
 from PyQt5.QtWidgets import QMessageBox, QFileDialog, QComboBox
 
 class ModManagerUI:
@@ -50,7 +51,7 @@ class ModManagerUI:
         # 使用 Modrinth API 搜索
         url = f"https://api.modrinth.com/v2/search?query={mod_name}&facets=[[\"project_type:mod\"]]"
         try:
-            resp = requests.get(url, timeout=10)
+            resp = get_session().get(url, timeout=10)
             data = resp.json()
             if not data['hits']:
                 QMessageBox.warning(self.main_window, "未找到", "未找到相关模组")
@@ -60,7 +61,7 @@ class ModManagerUI:
             project_id = mod['project_id']
             # 获取最新版本文件
             files_url = f"https://api.modrinth.com/v2/project/{project_id}/version"
-            files_resp = requests.get(files_url, timeout=10)
+            files_resp = get_session().get(files_url, timeout=10)
             files = files_resp.json()
             if not files:
                 QMessageBox.warning(self.main_window, "未找到", "未找到模组文件")
@@ -72,9 +73,11 @@ class ModManagerUI:
                 os.makedirs(mods_dir, exist_ok=True)
             file_name = files[0]['files'][0]['filename']
             file_path = os.path.join(mods_dir, file_name)
-            with requests.get(file_url, stream=True) as r:
+            limiter = get_bandwidth_limiter()
+            with get_session().get(file_url, stream=True) as r:
                 with open(file_path, 'wb') as f:
                     for chunk in r.iter_content(chunk_size=8192):
+                        limiter.consume(len(chunk), PRIORITY_MODS) # 模组下载优先级最低
                         f.write(chunk)
             self.refresh_mod_list()
             QMessageBox.information(self.main_window, "成功", f"模组 {file_name} 已下载！")
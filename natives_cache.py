@@ -0,0 +1,84 @@
+import os
+import json
+import hashlib
+import shutil
+import zipfile
+from metadata_cache import DEFAULT_CACHE_DIR
+from object_store import link_or_copy
+from library_rules import rules_allow, native_artifact
+
+# 解压完成的标记文件
+COMPLETE_MARKER = ".complete"
+
+
+def native_jars(version_info, libraries_dir):
+    """版本 JSON 中当前系统需要解压的 natives：[(jar 路径, sha1, 排除列表)]"""
+    jars = []
+    for library in version_info.get("libraries", []):
+        if not rules_allow(library.get("rules")):
+            continue
+        artifact = native_artifact(library)
+        if artifact:
+            path = os.path.join(libraries_dir, artifact["path"])
+            exclude = library.get("extract", {}).get("exclude", [])
+            jars.append((path, artifact.get("sha1"), exclude))
+    return jars
+
+
+class NativesCache:
+    """按 natives jar 的 sha1 缓存解压结果
+
+    每个 jar 只解压一次到 <root>/jars/<sha1>/；一个版本用到的 jar 组合再链接到
+    <root>/sets/<组合哈希>/，作为 -Djava.library.path。不同实例、每次启动都直接复用。
+    """
+
+    def __init__(self, root=None):
+        self.root = root or os.path.join(DEFAULT_CACHE_DIR, 'natives')
+
+    def _extract_jar(self, jar_path, sha1, exclude):
+        key = sha1 or hashlib.sha1(jar_path.encode('utf-8')).hexdigest()
+        target = os.path.join(self.root, 'jars', key)
+        if os.path.exists(os.path.join(target, COMPLETE_MARKER)):
+            return target
+        tmp_target = target + '.tmp'
+        shutil.rmtree(tmp_target, ignore_errors=True)
+        os.makedirs(tmp_target)
+        with zipfile.ZipFile(jar_path) as jar:
+            for member in jar.infolist():
+                name = member.filename
+                if member.is_dir() or any(name.startswith(prefix) for prefix in exclude) or name.startswith('META-INF/'):
+                    continue
+                # natives 都放在根目录，忽略 jar 内的子目录
+                dest = os.path.join(tmp_target, os.path.basename(name))
+                with jar.open(member) as src, open(dest, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+        open(os.path.join(tmp_target, COMPLETE_MARKER), 'w').close()
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp_target, target)
+        return target
+
+    def prepare(self, jars):
+        """准备一组 natives 的目录并返回路径；已准备过时不做任何解压"""
+        keys = sorted(sha1 or path for path, sha1, _ in jars)
+        set_key = hashlib.sha1(json.dumps(keys).encode('utf-8')).hexdigest()
+        set_dir = os.path.join(self.root, 'sets', set_key)
+        if os.path.exists(os.path.join(set_dir, COMPLETE_MARKER)):
+            return set_dir
+
+        tmp_dir = set_dir + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for jar_path, sha1, exclude in jars:
+            extracted = self._extract_jar(jar_path, sha1, exclude)
+            for name in os.listdir(extracted):
+                if name == COMPLETE_MARKER or os.path.exists(os.path.join(tmp_dir, name)):
+                    continue
+                link_or_copy(os.path.join(extracted, name), os.path.join(tmp_dir, name))
+        open(os.path.join(tmp_dir, COMPLETE_MARKER), 'w').close()
+        shutil.rmtree(set_dir, ignore_errors=True)
+        os.replace(tmp_dir, set_dir)
+        return set_dir
+
+    def prepare_version(self, version_info, libraries_dir):
+        """根据版本 JSON 准备 natives 目录"""
+        return self.prepare(native_jars(version_info, libraries_dir))
@@ -0,0 +1,133 @@
+import os
+import sys
+import shutil
+import hashlib
+import threading
+from metadata_cache import DEFAULT_CACHE_DIR
+from verify_index import VerifiedIndex
+
+# Linux 上的 FICLONE ioctl，用于在支持的文件系统（btrfs/xfs）上创建 reflink
+FICLONE = 0x40049409
+
+
+def _reflink(src, dst):
+    """尝试创建写时复制的副本，不支持时抛出 OSError"""
+    if not sys.platform.startswith("linux"):
+        raise OSError("reflink 仅支持 Linux")
+    import fcntl
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.remove(dst)
+            raise
+
+
+def sha1_file(path):
+    """分块计算文件的 sha1，不会把整个文件读入内存"""
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def link_or_copy(src, dst):
+    """依次尝试硬链接、reflink、普通复制，返回实际使用的方式"""
+    try:
+        os.link(src, dst)
+        return "hardlink"
+    except OSError:
+        pass
+    try:
+        _reflink(src, dst)
+        return "reflink"
+    except OSError:
+        pass
+    shutil.copyfile(src, dst)
+    return "copy"
+
+
+class ObjectStore:
+    """按 sha1 寻址的共享文件仓库
+
+    所有版本实例的库文件和资源文件都存一份在这里，实例目录中的文件通过硬链接
+    （或 reflink、复制）指向仓库中的对象，相同的文件只下载和存储一次。
+
+    硬链接的实例文件和仓库对象是同一个文件，实例中的文件被原地修改时仓库对象也会损坏，
+    因此链接前按仓库自己的校验索引（大小 + 修改时间）确认对象完好，变化过的对象重新哈希，
+    不一致时从仓库中删除。
+    """
+
+    def __init__(self, root=None):
+        self.root = root or os.path.join(DEFAULT_CACHE_DIR, 'objects')
+        self.verified_index = VerifiedIndex(os.path.join(self.root, 'verified_index.json'))
+
+    def path_for(self, sha1):
+        return os.path.join(self.root, sha1[:2], sha1)
+
+    def has(self, sha1, size=None):
+        try:
+            st = os.stat(self.path_for(sha1))
+        except OSError:
+            return False
+        return size is None or st.st_size == size
+
+    def verify(self, sha1, size=None):
+        """确认仓库中的对象存在且内容与 sha1 一致；损坏的对象会被删除"""
+        path = self.path_for(sha1)
+        if not self.has(sha1, size):
+            return False
+        if self.verified_index.lookup(path) == sha1:
+            return True
+        try:
+            actual = sha1_file(path)
+        except OSError:
+            return False
+        if actual != sha1:
+            print(f"[WARN] 共享仓库中的 {sha1} 已损坏，删除")
+            self.verified_index.forget(path)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return False
+        self.verified_index.record(path, sha1)
+        return True
+
+    def materialize(self, sha1, target_path, size=None):
+        """把仓库中已校验的对象放到 target_path，仓库中没有或对象已损坏时返回 False"""
+        if not self.verify(sha1, size):
+            return False
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        tmp_path = f"{target_path}.{threading.get_ident()}.link"
+        try:
+            link_or_copy(self.path_for(sha1), tmp_path)
+            os.replace(tmp_path, target_path)
+        except OSError as e:
+            print(f"[WARN] 从共享仓库链接 {sha1} 失败：{e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+        return True
+
+    def add(self, file_path, sha1):
+        """把已校验的文件加入仓库（已存在时跳过）"""
+        store_path = self.path_for(sha1)
+        if os.path.exists(store_path):
+            return
+        os.makedirs(os.path.dirname(store_path), exist_ok=True)
+        tmp_path = f"{store_path}.{threading.get_ident()}.tmp"
+        try:
+            link_or_copy(file_path, tmp_path)
+            os.replace(tmp_path, store_path)
+            self.verified_index.record(store_path, sha1)
+        except OSError as e:
+            print(f"[WARN] 加入共享仓库失败 {file_path}：{e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def save(self):
+        """保存仓库的校验索引"""
+        self.verified_index.save()
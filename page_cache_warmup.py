@@ -0,0 +1,129 @@
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 同时预读的文件数（网络共享或机械硬盘上主要是等待延迟，多个请求可以排队并行）
+WARMUP_WORKERS = 8
+# 单次最多预读的字节数，避免把其它程序的缓存挤出去
+WARMUP_MAX_BYTES = 512 * 1024 * 1024
+# 没有 posix_fadvise 时，逐块读取文件的块大小
+READ_CHUNK = 1024 * 1024
+# 启动时会读取的资源文件（按资源名前缀）；音效等其它资源在游戏中按需加载
+HOT_ASSET_PREFIXES = (
+    "icons/",
+    "pack.mcmeta",
+    "minecraft/sounds.json",
+    "minecraft/lang/",
+    "minecraft/font/",
+    "minecraft/textures/",  # 1.6 之前的版本材质在资源文件中
+    "minecraft/sounds/ui/",
+    "minecraft/sounds/random/click",
+)
+
+_local = threading.local()
+
+
+def hot_assets(assets_dir, index_id):
+    """资源索引中启动时会读取的资源对象路径"""
+    if not index_id:
+        return []
+    try:
+        with open(os.path.join(assets_dir, "indexes", f"{index_id}.json"), 'r', encoding='utf-8') as f:
+            objects = json.load(f).get("objects", {})
+    except (OSError, ValueError):
+        return []
+    paths = []
+    for name, info in objects.items():
+        if name.startswith(HOT_ASSET_PREFIXES):
+            sha1 = info["hash"]
+            paths.append(os.path.join(assets_dir, "objects", sha1[:2], sha1))
+    return paths
+
+
+def _advise(path):
+    """让内核在后台把整个文件读入页缓存，调用本身几乎不阻塞"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        size = os.fstat(fd).st_size
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
+    return size
+
+
+def _read_through(path):
+    """没有 fadvise 的系统上直接读一遍文件，数据留在系统的文件缓存中"""
+    buffer = getattr(_local, "buffer", None)
+    if buffer is None:
+        buffer = _local.buffer = bytearray(READ_CHUNK)
+    size = 0
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            size += n
+    return size
+
+
+class WarmupResult:
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.skipped = 0  # 超出预算或无法读取的文件
+        self.seconds = 0.0
+
+
+def warm_files(paths, max_bytes=WARMUP_MAX_BYTES, workers=WARMUP_WORKERS):
+    """按顺序预读文件（靠前的优先），返回 WarmupResult"""
+    started = time.perf_counter()
+    result = WarmupResult()
+    warm = _advise if hasattr(os, "posix_fadvise") else _read_through
+    budget = [max_bytes]
+    lock = threading.Lock()
+    seen = set()
+
+    def work(path):
+        # 先从预算中扣除文件大小，预算不足时跳过（线程池基本按提交顺序执行，靠前的文件优先）
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            with lock:
+                result.skipped += 1
+            return
+        with lock:
+            if size > budget[0]:
+                result.skipped += 1
+                return
+            budget[0] -= size
+        try:
+            warm(path)
+        except OSError:
+            with lock:
+                result.skipped += 1
+            return
+        with lock:
+            result.files += 1
+            result.bytes += size
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="warmup") as executor:
+        for path in paths:
+            if path not in seen:
+                seen.add(path)
+                executor.submit(work, path)
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def warm_in_background(paths, callback=None, max_bytes=WARMUP_MAX_BYTES):
+    """在后台线程中预读，与 JVM 启动同时进行；完成后以 WarmupResult 调用 callback"""
+    def run():
+        result = warm_files(paths, max_bytes)
+        if callback:
+            callback(result)
+
+    thread = threading.Thread(target=run, name="page-cache-warmup", daemon=True)
+    thread.start()
+    return thread
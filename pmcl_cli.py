@@ -0,0 +1,204 @@
+"""PMCL 命令行：不依赖 PyQt，用于批量预下载版本、预热共享缓存
+
+示例：
+    python pmcl_cli.py prefetch 1.20.1 1.19.4 --dir D:\\versions_isolated
+    python pmcl_cli.py prefetch --releases-since 1.18 --jobs 32 --json
+    python pmcl_cli.py serve --port 8765
+
+退出码：0 成功，1 下载失败，2 文件校验失败。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from urllib.parse import urljoin
+from downloader import MinecraftDownloader, VerificationError, DownloadFailed, DEFAULT_MAX_WORKERS, select_fastest_mirror
+from metadata_cache import MetadataCache
+from download_planner import DownloadPlan, PlanProgress
+from progress_bus import ProgressAggregator
+from object_store import ObjectStore
+from mirror_server import serve, DEFAULT_PORT, DEFAULT_UPSTREAM
+from transfer_metrics import get_transfer_metrics
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_VERIFY_FAILED = 2
+
+
+def default_versions_dir():
+    """与 ConfigManager 的默认版本隔离目录一致"""
+    project_root = os.path.abspath(os.path.dirname(__file__))
+    return os.path.join(os.path.dirname(project_root), 'versions_isolated')
+
+
+def releases_since(manifest, since):
+    """清单中从最新正式版到 since（含）的所有正式版"""
+    result = []
+    for v in manifest["versions"]:
+        if v.get("type") != "release":
+            continue
+        result.append(v["id"])
+        if v["id"] == since:
+            return result
+    raise SystemExit(f"清单中找不到正式版 {since}")
+
+
+class Reporter:
+    """输出进度：--json 时每行一个 JSON 事件，否则输出可读文本"""
+
+    def __init__(self, as_json):
+        self.as_json = as_json
+
+    def event(self, name, **fields):
+        if self.as_json:
+            print(json.dumps({"event": name, "time": round(time.time(), 3), **fields}, ensure_ascii=False), flush=True)
+        else:
+            text = " ".join(f"{k}={v}" for k, v in fields.items())
+            print(f"[{name}] {text}", flush=True)
+
+    def progress(self, update):
+        self.event("progress", bytes=update.current_bytes, total_bytes=update.total_bytes,
+                   files=update.done_files, total_files=update.total_files,
+                   speed=round(update.speed), eta=None if update.eta is None else round(update.eta, 1))
+
+
+def write_metrics(args):
+    """按参数导出本次下载的传输指标"""
+    metrics = get_transfer_metrics()
+    if args.metrics_json:
+        metrics.write_json(args.metrics_json)
+    if args.metrics_prom:
+        metrics.write_prometheus(args.metrics_prom)
+
+
+def prefetch(args):
+    reporter = Reporter(args.json)
+    base_dir = args.dir or default_versions_dir()
+    store = ObjectStore(os.path.join(base_dir, '.objects'))
+    started = time.time()
+
+    metadata_cache = MetadataCache()
+    # 只选择一次镜像，所有版本共用
+    if args.mirror:
+        mirror = {"name": f"Custom ({args.mirror})", "manifest": urljoin(args.mirror, "mc/game/version_manifest.json"), "base": args.mirror}
+    else:
+        mirror = select_fastest_mirror()
+    versions = list(args.versions)
+    if args.releases_since:
+        versions += releases_since(metadata_cache.get_manifest(mirror['manifest']), args.releases_since)
+    versions = list(dict.fromkeys(versions))
+    if not versions:
+        raise SystemExit("请指定版本号或 --releases-since")
+
+    # 分别规划各版本，再按 sha1 去重合并成一个计划，一起并发下载
+    combined = DownloadPlan()
+    owners = {}      # sha1 或路径 -> 负责下载的任务
+    members = []     # (下载器, 任务)
+    downloaders = []
+    for version in versions:
+        downloader = MinecraftDownloader(os.path.join(base_dir, version), mirror, max_workers=args.jobs,
+                                         metadata_cache=metadata_cache, object_store=store)
+        downloaders.append(downloader)
+        plan_started = time.time()
+        plan = downloader.plan_version(version)
+        if not args.no_assets:
+            downloader.plan_assets(version, plan)
+        downloader.save_indexes()
+        for job in plan.jobs:
+            key = job.sha1 or job.path
+            if key not in owners:
+                owners[key] = job
+                combined.add(job)
+            members.append((downloader, job))
+        reporter.event("plan", version=version, files=len(plan), bytes=plan.total_size,
+                       skipped=plan.skipped, seconds=round(time.time() - plan_started, 3))
+
+    reporter.event("start", versions=versions, files=len(combined), bytes=combined.total_size, mirror=mirror['name'])
+    progress = PlanProgress(combined.total_size, total_files=len(combined))
+    aggregator = ProgressAggregator(progress, reporter.progress, rate_hz=args.rate)
+    aggregator.start()
+    runner = downloaders[0]
+    try:
+        # 合并后的计划由一个下载器统一执行，共用一个线程池和各主机的连接数限制
+        runner.run_plan(combined, progress=progress)
+    finally:
+        aggregator.stop()
+        write_metrics(args)
+        # 执行计划的下载器会把其它版本目录中的文件记入自己的校验索引，这些文件由规划它们的下载器记录
+        for downloader, job in members:
+            if downloader is not runner and owners[job.sha1 or job.path] is job:
+                runner.verified_index.forget(job.path)
+
+    # 其它版本中相同的文件从共享仓库链接过去，并记入各自的校验索引
+    missing = []
+    for downloader, job in members:
+        if not job.sha1:
+            continue
+        # 负责下载的任务在下载时已校验；其余任务路径上可能是损坏或过期的文件（所以才在计划中），一律重新链接
+        if job.path != owners[job.sha1].path and not store.materialize(job.sha1, job.path, job.size):
+            missing.append((job, Exception(f"共享仓库中缺少 {job.sha1}")))
+            continue
+        downloader.verified_index.record(job.path, job.sha1)
+    for downloader in downloaders:
+        downloader.save_indexes()
+    if missing:
+        raise DownloadFailed(missing)
+
+    elapsed = time.time() - started
+    reporter.event("done", versions=versions, files=len(combined), bytes=combined.total_size,
+                   seconds=round(elapsed, 3), bytes_per_second=round(combined.total_size / elapsed) if elapsed > 0 else 0)
+    return EXIT_OK
+
+
+def serve_mirror(args):
+    base_dir = args.dir or default_versions_dir()
+    # 与 prefetch 和启动器共用同一个共享仓库，已下载过的文件不必再从上游获取
+    serve(args.host, args.port, args.upstream, store=ObjectStore(os.path.join(base_dir, '.objects')), verbose=args.verbose)
+    return EXIT_OK
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="pmcl_cli", description="PMCL 命令行工具（无界面）")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("prefetch", help="批量下载版本文件，预热共享缓存")
+    p.add_argument("versions", nargs="*", help="要下载的版本号")
+    p.add_argument("--releases-since", metavar="VERSION", help="下载从最新正式版到该版本的所有正式版")
+    p.add_argument("--dir", help="版本隔离基础目录（默认与启动器相同）")
+    p.add_argument("--mirror", help="镜像源地址，默认自动选择")
+    p.add_argument("--jobs", type=int, default=DEFAULT_MAX_WORKERS, help="并发下载数")
+    p.add_argument("--no-assets", action="store_true", help="不下载资源文件")
+    p.add_argument("--json", action="store_true", help="以 JSON Lines 输出进度和耗时")
+    p.add_argument("--rate", type=float, default=1, help="进度输出频率（次/秒）")
+    p.add_argument("--metrics-json", metavar="PATH", help="把各文件的传输耗时统计写入 JSON 文件")
+    p.add_argument("--metrics-prom", metavar="PATH", help="把传输耗时统计写入 Prometheus textfile")
+    p.set_defaults(func=prefetch)
+
+    p = sub.add_parser("serve", help="作为局域网缓存镜像运行，供其它 PMCL 设置为自定义镜像源")
+    p.add_argument("--host", default="0.0.0.0", help="监听地址")
+    p.add_argument("--port", type=int, default=DEFAULT_PORT, help="监听端口")
+    p.add_argument("--upstream", default=DEFAULT_UPSTREAM, help="上游镜像地址（BMCLAPI 格式）")
+    p.add_argument("--dir", help="版本隔离基础目录，使用其中的共享仓库（默认与启动器相同）")
+    p.add_argument("--verbose", action="store_true", help="输出每个请求")
+    p.add_argument("--json", action="store_true", help=argparse.SUPPRESS)
+    p.set_defaults(func=serve_mirror)
+
+    args = parser.parse_args(argv)
+    try:
+        return args.func(args)
+    except VerificationError as e:
+        Reporter(args.json).event("error", kind="verification", message=str(e))
+        return EXIT_VERIFY_FAILED
+    except DownloadFailed as e:
+        verification = any(isinstance(error, VerificationError) for _, error in e.failures)
+        Reporter(args.json).event("error", kind="verification" if verification else "download",
+                                  message=str(e), files=[job.path for job, _ in e.failures])
+        return EXIT_VERIFY_FAILED if verification else EXIT_FAILED
+    except Exception as e:
+        Reporter(args.json).event("error", kind="download", message=str(e))
+        return EXIT_FAILED
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+import os
+import time
+import threading
+
+# 界面刷新频率（次/秒）
+DEFAULT_RATE_HZ = 10
+# 速度的指数加权平均系数
+SPEED_EWMA_ALPHA = 0.3
+# 更新中最多携带的正在下载文件数
+MAX_ACTIVE_FILES = 5
+
+
+class ProgressUpdate:
+    """一次合并后的进度更新"""
+
+    __slots__ = ("current_bytes", "total_bytes", "done_files", "total_files",
+                 "speed", "eta", "active_files", "finished")
+
+    def __init__(self, current_bytes, total_bytes, done_files, total_files, speed, eta, active_files, finished=False):
+        self.current_bytes = current_bytes
+        self.total_bytes = total_bytes
+        self.done_files = done_files
+        self.total_files = total_files
+        self.speed = speed
+        self.eta = eta
+        self.active_files = active_files
+        self.finished = finished
+
+    @property
+    def percent(self):
+        if self.total_bytes <= 0:
+            return 100.0 if self.finished else 0.0
+        return min(self.current_bytes / self.total_bytes * 100, 100.0)
+
+
+class ProgressAggregator:
+    """按固定频率采样 PlanProgress，合并成 ProgressUpdate 后调用 emit
+
+    下载线程只更新计数，不再逐块通知界面；不论有多少线程、链路多快，界面每秒
+    最多收到 rate_hz 次更新。
+    """
+
+    def __init__(self, progress, emit, rate_hz=DEFAULT_RATE_HZ):
+        self.progress = progress
+        self.emit = emit
+        self.interval = 1.0 / rate_hz
+        self._stop = threading.Event()
+        self._thread = None
+        self._speed = 0.0
+        self._last_bytes = 0
+        self._last_time = time.time()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="progress-bus", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止采样，并发出最后一次更新"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._tick(finished=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._tick()
+
+    def _tick(self, finished=False):
+        current, done_files, active = self.progress.snapshot()
+        now = time.time()
+        elapsed = now - self._last_time
+        if elapsed > 0:
+            sample = (current - self._last_bytes) / elapsed
+            self._speed = SPEED_EWMA_ALPHA * sample + (1 - SPEED_EWMA_ALPHA) * self._speed
+        self._last_bytes = current
+        self._last_time = now
+        total = self.progress.total_bytes
+        eta = max(total - current, 0) / self._speed if self._speed > 0 else None
+        self.emit(ProgressUpdate(
+            current, total, done_files, self.progress.total_files, self._speed, eta,
+            [os.path.basename(path) for path in active[:MAX_ACTIVE_FILES]], finished,
+        ))
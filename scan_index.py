@@ -0,0 +1,50 @@
+import os
+
+
+def scan_tree(root):
+    """用 os.scandir 遍历目录树，返回 {绝对路径: (大小, 修改时间ns)}
+
+    Windows 上 DirEntry.stat() 的结果直接来自目录枚举，不需要额外的系统调用，
+    比逐个 os.path.exists/os.stat 快得多（尤其是有杀毒软件或网络共享时）。
+    未完成的 .part 文件不计入结果。
+    """
+    files = {}
+    stack = [os.path.abspath(root)]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif not entry.name.endswith('.part'):
+                            st = entry.stat()
+                            files[entry.path] = (st.st_size, st.st_mtime_ns)
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return files
+
+
+class PresenceIndex:
+    """若干目录的文件快照，用于在内存中判断文件是否存在
+
+    每个根目录只扫描一次；不在任何根目录下的路径返回 None 表示未知，调用方应
+    退回到 os.stat。
+    """
+
+    def __init__(self, roots):
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.files = {}
+        for root in self.roots:
+            self.files.update(scan_tree(root))
+
+    def covers(self, path):
+        path = os.path.abspath(path)
+        return any(path.startswith(root + os.sep) for root in self.roots)
+
+    def get(self, path):
+        """返回 (大小, 修改时间ns)；文件不存在时返回 None"""
+        return self.files.get(os.path.abspath(path))
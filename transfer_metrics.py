@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import bisect
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# 各阶段耗时的直方图分桶（秒）
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# 文件大小的直方图分桶（字节）
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(10))  # 1 KB ~ 256 MB
+# 保留最近多少条传输的明细
+RECENT_TRANSFERS = 256
+# 记录的耗时阶段：
+#   queue    等待主机并发名额    dns      域名解析          connect  TCP 连接
+#   tls      TLS 握手            ttfb     发出请求到收到响应头
+#   transfer 接收响应体（包含其间的 hash、disk、throttle、callback）
+#   hash     计算 sha1           disk     写入磁盘
+#   throttle 限速等待            callback 进度回调（界面）  total    整个传输
+TIMINGS = ("queue", "dns", "connect", "tls", "ttfb", "transfer", "hash", "disk", "throttle", "callback", "total")
+PROMETHEUS_PREFIX = "pmcl_download"
+
+_local = threading.local()
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+class Histogram:
+    """固定分桶的直方图，只记录每个桶的计数、总和与总数"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self):
+        return {
+            "buckets": {str(b): c for b, c in zip(self.buckets + ("+Inf",), self.counts)},
+            "sum": round(self.sum, 6),
+            "count": self.count,
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+        }
+
+
+class TransferRecord:
+    """一次 HTTP 传输（一个文件或一个分段）的明细"""
+
+    __slots__ = ("url", "mirror", "bytes", "retries", "resumed", "new_connection", "ok", "error", "started") + TIMINGS
+
+    def __init__(self, url=None, mirror=None, retries=0):
+        self.url = url
+        self.mirror = mirror
+        self.bytes = 0
+        self.retries = retries
+        self.resumed = False
+        self.new_connection = False
+        self.ok = False
+        self.error = None
+        self.started = time.time()
+        for name in TIMINGS:
+            setattr(self, name, 0.0)
+
+    def add(self, name, seconds):
+        setattr(self, name, getattr(self, name) + seconds)
+
+    def to_dict(self):
+        result = {name: getattr(self, name) for name in ("url", "mirror", "bytes", "retries", "resumed", "new_connection", "ok", "error")}
+        result["started"] = round(self.started, 3)
+        for name in TIMINGS:
+            result[name] = round(getattr(self, name), 6)
+        return result
+
+
+def current_transfer():
+    """当前线程正在进行的传输记录；不在 transfer() 中时返回一个不会被统计的记录"""
+    record = getattr(_local, "record", None)
+    return record if record is not None else TransferRecord()
+
+
+def note_connection(dns=0.0, connect=0.0, tls=0.0):
+    """由 http_session 在建立新连接时调用"""
+    record = getattr(_local, "record", None)
+    if record is not None:
+        record.new_connection = True
+        record.dns += dns
+        record.connect += connect
+        record.tls += tls
+
+
+class TransferMetrics:
+    """下载指标：每次传输的各阶段耗时汇总为直方图，按镜像统计次数和流量
+
+    每次传输只做常数次计时和一次加锁汇总，可以在正式环境中一直开启。
+    可导出为 JSON 或 Prometheus 文本格式（node_exporter 的 textfile 收集器）。
+    """
+
+    def __init__(self, recent=RECENT_TRANSFERS):
+        self._lock = threading.Lock()
+        self._recent_size = recent
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._timings = {name: Histogram(SECONDS_BUCKETS) for name in TIMINGS}
+            self._sizes = Histogram(BYTES_BUCKETS)
+            self._mirrors = {}
+            self._recent = deque(maxlen=self._recent_size)
+
+    @contextmanager
+    def transfer(self, url, mirror=None, retries=0):
+        """统计一次传输，期间本线程的 current_transfer() 返回这条记录"""
+        record = TransferRecord(url, mirror, retries)
+        previous = getattr(_local, "record", None)
+        _local.record = record
+        started = time.perf_counter()
+        try:
+            yield record
+            record.ok = True
+        except BaseException as e:
+            record.error = type(e).__name__
+            raise
+        finally:
+            record.total = time.perf_counter() - started
+            _local.record = previous
+            self.record(record)
+
+    def record(self, record):
+        with self._lock:
+            mirror = self._mirrors.get(record.mirror)
+            if mirror is None:
+                mirror = self._mirrors[record.mirror] = {
+                    "transfers": 0, "failures": 0, "bytes": 0, "retries": 0, "new_connections": 0, "seconds": 0.0,
+                }
+            mirror["transfers"] += 1
+            mirror["bytes"] += record.bytes
+            mirror["retries"] += record.retries
+            mirror["seconds"] += record.total
+            if record.new_connection:
+                mirror["new_connections"] += 1
+            if not record.ok:
+                mirror["failures"] += 1
+                self._recent.append(record)
+                return
+            for name in TIMINGS:
+                self._timings[name].observe(getattr(record, name))
+            self._sizes.observe(record.bytes)
+            self._recent.append(record)
+
+    def snapshot(self):
+        """当前全部指标（dict，可直接转为 JSON）"""
+        with self._lock:
+            return {
+                "timings": {name: h.to_dict() for name, h in self._timings.items()},
+                "bytes": self._sizes.to_dict(),
+                "mirrors": {str(name): dict(stats, seconds=round(stats["seconds"], 6))
+                            for name, stats in self._mirrors.items()},
+                "recent": [record.to_dict() for record in self._recent],
+            }
+
+    def to_prometheus(self):
+        """Prometheus 文本格式"""
+        lines = []
+        with self._lock:
+            for name, histogram in self._timings.items():
+                self._histogram_lines(lines, f"{PROMETHEUS_PREFIX}_{name}_seconds", f"Time spent in the {name} phase of a transfer", histogram)
+            self._histogram_lines(lines, f"{PROMETHEUS_PREFIX}_size_bytes", "Size of transferred files", self._sizes)
+            counters = (
+                ("transfers", "Transfers attempted"),
+                ("failures", "Transfers that failed"),
+                ("bytes", "Bytes received"),
+                ("retries", "Retries before a transfer succeeded or failed"),
+                ("new_connections", "Transfers that opened a new connection"),
+            )
+            for key, help_text in counters:
+                metric = f"{PROMETHEUS_PREFIX}_{key}_total"
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} counter")
+                for mirror, stats in self._mirrors.items():
+                    lines.append(f'{metric}{{mirror="{_label(mirror)}"}} {stats[key]}')
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _histogram_lines(lines, metric, help_text, histogram):
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} histogram")
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+            cumulative += count
+            lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f"{metric}_sum {histogram.sum}")
+        lines.append(f"{metric}_count {histogram.count}")
+
+    def write_json(self, path):
+        _write_atomic(path, json.dumps(self.snapshot(), ensure_ascii=False, indent=2))
+
+    def write_prometheus(self, path):
+        # textfile 收集器要求原子替换，避免读到写了一半的文件
+        _write_atomic(path, self.to_prometheus())
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _write_atomic(path, text):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def get_transfer_metrics():
+    """获取进程内共享的下载指标"""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = TransferMetrics()
+    return _metrics
@@ -0,0 +1,135 @@
+import time
+import random
+import threading
+import requests
+import urllib3.exceptions
+
+# 文件传输的重试次数（每个镜像）和指数退避参数（秒）
+RETRY_ATTEMPTS = 4
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8
+# 值得重试的 HTTP 状态码
+RETRYABLE_STATUS = (408, 425, 429, 500, 502, 503, 504)
+# 熔断：连续失败多少次后暂停使用该主机，以及暂停时长（秒，连续熔断时翻倍）
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 30
+BREAKER_MAX_COOLDOWN = 300
+
+_breaker = None
+_breaker_lock = threading.Lock()
+
+
+class IncompleteDownloadError(Exception):
+    """连接提前结束，收到的数据少于文件大小（.part 会保留用于续传）"""
+
+
+class DownloadCancelled(Exception):
+    """下载被用户取消"""
+
+
+class CircuitOpenError(Exception):
+    """主机处于熔断状态，暂不向其发送请求"""
+
+
+def is_retryable(error):
+    """网络错误、超时、数据不完整和 5xx/429 可以重试；404、校验失败等不重试"""
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code in RETRYABLE_STATUS
+    return isinstance(error, (
+        requests.ConnectionError,
+        requests.Timeout,
+        requests.exceptions.ChunkedEncodingError,
+        urllib3.exceptions.HTTPError,  # 直接读取 response.raw 时抛出的超时和协议错误
+        ConnectionError,
+        TimeoutError,
+        IncompleteDownloadError,
+    ))
+
+
+class RetryPolicy:
+    """有上限的重试，退避时间为带完全随机抖动的指数退避
+
+    第 n 次重试前等待 [0, min(max_delay, base_delay * 2**n)] 之间的随机时间，
+    避免大量线程在同一时刻一起重试。
+    """
+
+    def __init__(self, attempts=RETRY_ATTEMPTS, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY):
+        self.attempts = max(1, int(attempts))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, retry):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+
+
+class CircuitBreaker:
+    """按主机熔断
+
+    某个主机连续失败 threshold 次后进入熔断，cooldown 秒内的请求直接失败；
+    冷却结束后只放行一个试探请求，成功则恢复，失败则再次熔断且冷却时间翻倍。
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN, max_cooldown=BREAKER_MAX_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._lock = threading.Lock()
+        self._hosts = {}  # 主机 -> {"failures", "open_until", "cooldown", "probing"}
+
+    def _state(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = {"failures": 0, "open_until": 0.0, "cooldown": self.cooldown, "probing": False}
+        return state
+
+    def allow(self, host):
+        """是否可以向 host 发送请求"""
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None or state["failures"] < self.threshold:
+                return True
+            if time.monotonic() < state["open_until"] or state["probing"]:
+                return False
+            # 冷却结束，放行一个试探请求
+            state["probing"] = True
+            return True
+
+    def record_success(self, host):
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is not None:
+                state.update(failures=0, probing=False, cooldown=self.cooldown)
+
+    def record_failure(self, host):
+        with self._lock:
+            state = self._state(host)
+            state["failures"] += 1
+            if state["probing"]:
+                state["probing"] = False
+                state["cooldown"] = min(state["cooldown"] * 2, self.max_cooldown)
+            if state["failures"] >= self.threshold:
+                state["open_until"] = time.monotonic() + state["cooldown"]
+                if state["failures"] == self.threshold:
+                    print(f"[WARN] {host} 连续失败 {state['failures']} 次，暂停使用 {state['cooldown']} 秒")
+
+    def release(self, host):
+        """请求既没有成功也没有失败（如被取消）：结束试探，下一个请求可以重新试探"""
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is not None:
+                state["probing"] = False
+
+    def is_open(self, host):
+        with self._lock:
+            state = self._hosts.get(host)
+            return state is not None and state["failures"] >= self.threshold and time.monotonic() < state["open_until"]
+
+
+def get_circuit_breaker():
+    """获取进程内共享的熔断器，所有下载器共用各主机的状态"""
+    global _breaker
+    if _breaker is None:
+        with _breaker_lock:
+            if _breaker is None:
+                _breaker = CircuitBreaker()
+    return _breaker
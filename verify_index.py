@@ -0,0 +1,64 @@
+import os
+import json
+import threading
+
+
+class VerifiedIndex:
+    """已校验文件索引
+
+    以 (路径, 大小, 修改时间) 为键记录文件的 sha1。文件未变化时直接复用上次的
+    校验结果，不必重新读取整个文件计算哈希。
+    """
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self._entries = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def save(self):
+        """有改动时写回磁盘（先写临时文件再替换）"""
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            tmp_path = self.index_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.index_path)
+            self._dirty = False
+
+    def lookup(self, file_path):
+        """文件未变化时返回记录的 sha1，否则返回 None"""
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        return self.lookup_stat(file_path, st.st_size, st.st_mtime_ns)
+
+    def lookup_stat(self, file_path, size, mtime_ns):
+        """与 lookup 相同，但使用调用方已有的大小和修改时间，不再访问磁盘"""
+        entry = self._entries.get(os.path.abspath(file_path))
+        if entry and entry[0] == size and entry[1] == mtime_ns:
+            return entry[2]
+        return None
+
+    def record(self, file_path, sha1):
+        """记录一个已校验通过的文件"""
+        st = os.stat(file_path)
+        with self._lock:
+            self._entries[os.path.abspath(file_path)] = [st.st_size, st.st_mtime_ns, sha1]
+            self._dirty = True
+
+    def forget(self, file_path):
+        with self._lock:
+            if self._entries.pop(os.path.abspath(file_path), None) is not None:
+                self._dirty = True